@@ -0,0 +1,64 @@
+import pygame
+from collections import OrderedDict
+from support import import_folder
+from settings import *
+
+class Asset_store:
+    # animation frames loaded from disk once per process and shared by every sprite that uses them
+    def __init__(self):
+        self.folders = {}
+
+    def import_folder(self, path):
+        if path not in self.folders:
+            self.folders[path] = import_folder(path)
+        return self.folders[path]
+
+    def import_animations(self, path, animations):
+        return {animation: self.import_folder(path + '/' + animation) for animation in animations}
+
+    def clear(self):
+        self.folders.clear()
+
+class Sprite_cache:
+    # rotated and scaled animation frames with their masks, keyed by (animation status, frame index, quantized size,
+    # quantized angle). least recently used entries are evicted once the cache is full
+    def __init__(self, max_size=SPRITE_CACHE_SIZE, angle_step=SPRITE_ANGLE_STEP, size_step=SPRITE_SIZE_STEP):
+        self.max_size = max_size
+        self.num_angles = max(1, round(360 / angle_step))
+        self.size_step = size_step
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, status, frame_index, frame, size, angle):
+        size_index = max(1, round(size / self.size_step))
+        angle_index = round(angle * self.num_angles / 360) % self.num_angles
+        key = (status, frame_index, size_index, angle_index)
+        entry = self.entries.get(key)
+        if entry:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        image = pygame.transform.rotozoom(frame, -90, size_index * self.size_step)
+        image = pygame.transform.rotate(image, -angle_index * 360 / self.num_angles)
+        entry = (image, pygame.mask.from_surface(image))
+        self.entries[key] = entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return entry
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups:
+            return self.hits / lookups
+        return 0
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+# shared by every organism and the player
+asset_store = Asset_store()
+sprite_cache = Sprite_cache()
@@ -0,0 +1,798 @@
+import pygame, time, sys, os, math, json, platform, argparse, tempfile, neat
+import numpy as np
+from copy import deepcopy
+from collections import defaultdict
+from types import SimpleNamespace
+from random import seed, random, randint, uniform, choice
+from particles import Particle, Particle_system, move_particle_systems, calc_forces, calc_forces_grid
+from environment import Environment
+from islands import Island_model
+from checkpoint import save_checkpoint, load_checkpoint
+from assets import Sprite_cache, asset_store
+from organism import Organism
+from support import import_folder, calc_diff, calc_mag
+from config import NUM_INPUTS, COMPAT_THRESHOLD
+from settings import *
+
+def create_particles(num_particles):
+    system = Particle_system()
+    group = pygame.sprite.Group()
+    for _ in range(num_particles):
+        Particle([group], (randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)), system, headless=True)
+    return system, group
+
+def copy_particles(system):
+    new_system, new_group = create_particles(0)
+    for i in range(system.count):
+        particle = Particle([new_group], (0, 0), new_system, headless=True)
+        particle.pos = system.pos[i]
+        particle.vel = system.vel[i]
+    return new_system, new_group
+
+def time_function(function, *args, repeats=3):
+    best_time = None
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - start_time
+        if best_time is None or elapsed < best_time:
+            best_time = elapsed
+    return best_time
+
+def reference_move_particles(group1, group2, g, dt):
+    # the kernel particles were moved with before Particle_system: one particle at a time, each seeing the already
+    # updated positions of the previous ones
+    if group1 and group2:
+        for particle1 in group1:
+            force = pygame.math.Vector2()
+            for particle2 in group2:
+                d = calc_diff(particle1.pos, particle2.pos)
+                r = calc_mag(d)
+                if r and r < MAP_WIDTH:
+                    direction = pygame.math.Vector2.normalize(d)
+                    force += (g * 1 / (r + 100)) * direction
+            particle1.vel = (particle1.vel + force * dt * 5) * 0.2
+            pos = particle1.pos + particle1.vel * dt * 5
+            if pos.x > MAP_WIDTH:
+                pos.x -= MAP_WIDTH
+            elif pos.x < 0:
+                pos.x += MAP_WIDTH
+            if pos.y > MAP_HEIGHT:
+                pos.y -= MAP_HEIGHT
+            elif pos.y < 0:
+                pos.y += MAP_HEIGHT
+            particle1.pos = pos
+
+def bench_particles(sizes=(100, 1000, 10000), g=10000, dt=1 / FPS, max_reference_rows=200):
+    print('move_particles: reference kernel vs batched particle systems')
+    for num_particles in sizes:
+        seed(num_particles)
+        system, group = create_particles(num_particles)
+        # the reference kernel is timed on a sample of rows and scaled up, as every row costs the same
+        sample = pygame.sprite.Group(group.sprites()[:max_reference_rows])
+        reference_time = time_function(reference_move_particles, sample, group, g, dt, repeats=1)
+        reference_time *= num_particles / len(sample)
+        batched_time = time_function(move_particle_systems, system, system, g, dt)
+        print('particles:', num_particles,
+              '\treference: ' + "{:.4f}".format(reference_time) + 's',
+              '\tbatched: ' + "{:.4f}".format(batched_time) + 's',
+              '\tspeedup: ' + "{:.0f}".format(reference_time / batched_time) + 'x')
+
+def check_particles(num_particles=200, g=10000, dt=1 / FPS, steps=10):
+    # compare one system moving through another, where both kernels see the same positions
+    seed(0)
+    system1, group1 = create_particles(num_particles)
+    system2, group2 = create_particles(num_particles)
+    reference_system, reference_group = copy_particles(system1)
+    for _ in range(steps):
+        reference_move_particles(reference_group, group2, g, dt)
+        move_particle_systems(system1, system2, g, dt)
+    error = calc_position_error(reference_system, system1)
+    print('max position error (separate systems): ' + "{:.2e}".format(error))
+    # self-interaction differs by the reference kernel updating positions one particle at a time, which
+    # compounds chaotically in clusters, so only a single step is compared
+    reference_system, reference_group = copy_particles(system1)
+    reference_move_particles(reference_group, reference_group, g, dt)
+    move_particle_systems(system1, system1, g, dt)
+    error = calc_position_error(reference_system, system1)
+    print('max position error (self-interaction, 1 step): ' + "{:.2e}".format(error))
+
+def check_solver(sizes=(1000, 10000), cell_sizes=(64, 128, 256), near_cells=(1, 2), g=10000):
+    print('grid solver vs exact kernel (force error relative to the rms exact force)')
+    for num_particles in sizes:
+        seed(num_particles)
+        system, _ = create_particles(num_particles)
+        pos = system.positions()
+        exact_time = time_function(calc_forces, pos, pos, g, repeats=1)
+        exact_force = calc_forces(pos, pos, g)
+        rms_force = np.sqrt((exact_force**2).sum(axis=1).mean())
+        print('particles:', num_particles, '\texact: ' + "{:.4f}".format(exact_time) + 's')
+        for cell_size in cell_sizes:
+            for near in near_cells:
+                grid_time = time_function(calc_forces_grid, pos, pos, g, cell_size, near)
+                error = np.sqrt(((calc_forces_grid(pos, pos, g, cell_size, near) - exact_force)**2).sum(axis=1))
+                print('\tcell:', cell_size, '\tnear cells:', near,
+                      '\tgrid: ' + "{:.4f}".format(grid_time) + 's',
+                      '\trms error: ' + "{:.2e}".format(np.sqrt((error**2).mean()) / rms_force),
+                      '\tmax error: ' + "{:.2e}".format(error.max() / rms_force))
+
+def create_world(num_organisms, num_food, headless=True):
+    # environment filled with randomly placed organisms and food of every size
+    environment = Environment(headless)
+    environment.energy_reserve = float('inf')
+    for _ in range(num_food - len(environment.food_group)):
+        environment.create_food((randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)), choice([1, 1, 1, 2, 2, 4, 8]))
+    for _ in range(num_organisms - len(environment.population)):
+        genome = environment.neat.create_genome()
+        genome.size = uniform(MIN_ORGANISM_SIZE, MAX_ORGANISM_SIZE)
+        genome.strength = INIT_ORGANISM_STRENGTH
+        genome.agility = INIT_ORGANISM_AGILITY
+        environment.create_organism(genome, (randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)))
+    return environment
+
+def reference_seek(organism, food_group):
+    # nearest food an organism can eat, found by scanning every food as Organism.seek did before the food grid
+    r0 = R_NORM + 1
+    d0 = pygame.math.Vector2()
+    for food in food_group:
+        if food.radius <= organism.size * 8:
+            d = calc_diff(organism.pos, food.pos)
+            r = calc_mag(d)
+            if r < r0:
+                d0 = d
+                r0 = r
+    phi = pygame.math.Vector2(organism.direction).angle_to((d0.x, d0.y))
+    if phi > 180:
+        phi -= 360
+    elif phi < -180:
+        phi += 360
+    return r0, phi
+
+def bench_seek(num_organisms=1000, num_food=5000, sample_size=50):
+    print('nearest food: scan of every food vs batched grid query')
+    seed(0)
+    environment = create_world(num_organisms, num_food)
+    sample = environment.population[:sample_size]
+    reference_time = time_function(lambda: [reference_seek(organism, environment.food_group) for organism in sample],
+                                   repeats=1)
+    reference_time *= len(environment.population) / len(sample)
+    # a moved food system forces the grid to be rebuilt, so the batched time includes the rebuild
+    def batched_seek():
+        environment.food_system.version += 1
+        environment.seek_food()
+    batched_time = time_function(batched_seek)
+    error = 0
+    for organism in sample:
+        reference = reference_seek(organism, environment.food_group)
+        error = max(error, abs(reference[0] - organism.target[0]), abs(reference[1] - organism.target[1]))
+    print('organisms:', len(environment.population), '\tfood:', len(environment.food_group),
+          '\treference: ' + "{:.4f}".format(reference_time) + 's',
+          '\tbatched: ' + "{:.4f}".format(batched_time) + 's',
+          '\tspeedup: ' + "{:.0f}".format(reference_time / batched_time) + 'x',
+          '\tmax error: ' + "{:.2e}".format(error))
+
+def create_genome(neat_instance, num_connects):
+    # grow a genome by structural mutations until it has at least num_connects connections
+    genome = neat_instance.create_genome()
+    while len(genome.genes) < num_connects:
+        if random() < 0.2:
+            genome.add_node()
+        else:
+            genome.add_connect()
+    return genome
+
+def bench_networks(sizes=(8, 50, 200), num_evaluations=1000):
+    print('network evaluation: node by node vs compiled plan')
+    seed(0)
+    neat_instance = neat.Neat()
+    for num_connects in sizes:
+        network = neat.Neural_network(create_genome(neat_instance, num_connects))
+        inputs = [np.array([uniform(0, R_NORM), uniform(-180, 180)]) for _ in range(num_evaluations)]
+        node_time = time_function(lambda: [network.get_node_outputs(x) for x in inputs])
+        plan_time = time_function(lambda: [network.get_outputs(x) for x in inputs])
+        error = max(np.abs(network.get_outputs(x) - network.get_node_outputs(x)).max() for x in inputs)
+        print('connections:', len(network.genome.genes), '\tlayers:', len(network.node_layers),
+              '\tnode by node: ' + "{:.1f}".format(node_time / num_evaluations * 1e6) + 'us',
+              '\tplan: ' + "{:.1f}".format(plan_time / num_evaluations * 1e6) + 'us',
+              '\tspeedup: ' + "{:.1f}".format(node_time / plan_time) + 'x',
+              '\tmax error: ' + "{:.2e}".format(error))
+
+def bench_brains(sizes=(100, 1000, 10000), num_mutations=10):
+    print('population inference: one network at a time vs Network_batch')
+    seed(0)
+    neat_instance = neat.Neat()
+    for num_networks in sizes:
+        networks = []
+        for _ in range(num_networks):
+            genome = neat_instance.create_genome()
+            for _ in range(num_mutations):
+                genome.mutate()
+            networks.append(neat.Neural_network(genome))
+        inputs = np.column_stack((np.random.uniform(0, R_NORM, num_networks), np.random.uniform(-180, 180, num_networks)))
+        single_time = time_function(lambda: [network.get_outputs(x) for network, x in zip(networks, inputs)])
+        batch = neat.Network_batch()
+        build_time = time_function(batch.build, networks, repeats=1)
+        batch_time = time_function(batch.evaluate, networks, inputs)
+        # one death and one birth, as between two frames of the game
+        newborn = neat.Neural_network(networks[0].genome.clone())
+        turnover_networks = networks[1:] + [newborn]
+        turnover_time = time_function(lambda: (batch.evaluate(turnover_networks, inputs),
+                                               batch.evaluate(networks, inputs))) / 2
+        print('networks:', num_networks, '\ttopologies:', len(batch.groups),
+              '\tsingle: ' + "{:.4f}".format(single_time) + 's',
+              '\tbatched: ' + "{:.4f}".format(batch_time) + 's',
+              '\tafter a birth and a death: ' + "{:.4f}".format(turnover_time) + 's',
+              '\tbuild: ' + "{:.4f}".format(build_time) + 's',
+              '\tspeedup: ' + "{:.0f}".format(single_time / batch_time) + 'x')
+
+def check_batch(rounds=200, num_networks=20, num_mutations=10):
+    # between evaluations a network dies and one is born, and a genome is mutated in place. the batch has to update
+    # their rows rather than evaluate stale weights
+    seed(0)
+    neat_instance = neat.Neat()
+    batch = neat.Network_batch()
+    networks = [neat.Neural_network(neat_instance.create_genome()) for _ in range(num_networks)]
+    num_wrong = 0
+    for _ in range(rounds):
+        genome = networks.pop(randint(0, len(networks) - 1)).genome.clone()
+        for _ in range(num_mutations):
+            genome.mutate()
+        genome.modify_weight(replace_all=True)
+        networks.insert(randint(0, len(networks)), neat.Neural_network(genome))
+        num_wrong += batch_is_wrong(batch, networks)
+        mutated = choice(networks).genome
+        mutated.mutate()
+        mutated.modify_weight(replace_all=True)
+        num_wrong += batch_is_wrong(batch, networks)
+    print('batch after network turnover and mutation: wrong outputs:', num_wrong, '/', 2 * rounds)
+    return num_wrong
+
+def batch_is_wrong(batch, networks):
+    inputs = np.column_stack((np.random.uniform(0, R_NORM, len(networks)), np.random.uniform(-180, 180, len(networks))))
+    outputs = batch.evaluate(networks, inputs)
+    expected = np.array([network.get_outputs(x) for network, x in zip(networks, inputs)])
+    return np.abs(outputs - expected).max() > 1e-12
+
+def init_display():
+    # images are converted for the display surface, so a (dummy) display is needed to load them
+    if pygame.display.get_surface() is None:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        pygame.init()
+        pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+def bench_sprites(num_organisms=100, num_frames=300):
+    print('organism sprites: rotozoom, rotate and mask every frame vs Sprite_cache')
+    init_display()
+    seed(0)
+    animations = {'idle': import_folder('graphics/organism/idle'), 'move': import_folder('graphics/organism/move')}
+    # organisms with fixed sizes turning at a steady rate, cycling through animation frames
+    organisms = [(uniform(MIN_ORGANISM_SIZE, 0.5), uniform(0, 360), uniform(-100, 100),
+                  choice(['idle', 'move'])) for _ in range(num_organisms)]
+    def frames():
+        for frame in range(num_frames):
+            for size, angle, rotation, status in organisms:
+                frame_index = frame // 8 % len(animations[status])
+                yield status, frame_index, animations[status][frame_index], size, angle + rotation * frame / FPS
+    def render_each_frame():
+        for status, frame_index, image, size, angle in frames():
+            image = pygame.transform.rotozoom(image, -90, size)
+            image = pygame.transform.rotate(image, -angle)
+            pygame.mask.from_surface(image)
+    cache = Sprite_cache()
+    def render_cached():
+        for status, frame_index, image, size, angle in frames():
+            cache.get(status, frame_index, image, size, angle)
+    reference_time = time_function(render_each_frame, repeats=1)
+    cached_time = time_function(render_cached, repeats=1)
+    print('organisms:', num_organisms, '\tframes:', num_frames,
+          '\tuncached: ' + "{:.2f}".format(reference_time / num_frames * 1000) + 'ms/frame',
+          '\tcached: ' + "{:.2f}".format(cached_time / num_frames * 1000) + 'ms/frame',
+          '\thits:', cache.hits, '\tmisses:', cache.misses, '\thit rate: ' + "{:.2f}".format(cache.hit_rate()))
+
+def bench_collisions(num_organisms=1000, num_food=5000):
+    print('organism-food collisions: spritecollide with masks vs grid broad phase')
+    init_display()
+    seed(0)
+    environment = create_world(num_organisms, num_food, headless=False)
+    population = environment.population
+    for organism in population:
+        organism.direction.rotate_ip(uniform(0, 360))
+        organism.move(0)
+    def reference():
+        return [pygame.sprite.spritecollide(organism, environment.food_group, False, pygame.sprite.collide_mask)
+                for organism in population]
+    def broad_phase(use_masks):
+        pos = np.array([(organism.pos.x, organism.pos.y) for organism in population])
+        if use_masks:
+            radii = np.array([math.hypot(organism.rect.width, organism.rect.height) / 2 + 1 for organism in population])
+        else:
+            radii = np.array([organism.radius for organism in population])
+        organisms, foods = environment.food_grid.overlaps(pos, radii)
+        if use_masks:
+            return [(i, j) for i, j in zip(organisms.tolist(), foods.tolist())
+                    if pygame.sprite.collide_mask(population[i], environment.food_grid.sprites[j])]
+        return list(zip(organisms.tolist(), foods.tolist()))
+    reference_time = time_function(reference, repeats=1)
+    mask_time = time_function(broad_phase, True)
+    circle_time = time_function(broad_phase, False)
+    print('organisms:', len(population), '\tfood:', len(environment.food_group),
+          '\treference: ' + "{:.4f}".format(reference_time) + 's',
+          '\tgrid + masks: ' + "{:.4f}".format(mask_time) + 's',
+          '\tgrid circles only: ' + "{:.4f}".format(circle_time) + 's',
+          '\tcollisions:', sum(map(len, reference())), '/', len(broad_phase(True)))
+
+def add_food_clusters(environment, num_clusters):
+    # tight clusters of small food that can merge
+    for _ in range(num_clusters):
+        x, y = randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)
+        radius = choice([1, 2, 4])
+        for _ in range(randint(4, 9)):
+            environment.create_food(((x + uniform(-radius, radius)) % MAP_WIDTH,
+                                     (y + uniform(-radius, radius)) % MAP_HEIGHT), radius)
+
+def reference_merge_one_food(environment):
+    # pairwise scan over the food group that merges at most one cluster, as Environment.merge_food did before the
+    # food grid. positions are read back from the food system once rather than once per pair
+    positions = {food: food.pos for food in environment.food_group}
+    for food1 in environment.food_group:
+        if food1.radius == 8:
+            continue
+        cluster = []
+        for food2 in environment.food_group:
+            if food1.radius == food2.radius:
+                d = calc_diff(positions[food1], positions[food2])
+                r = calc_mag(d)
+                if r < food1.radius * 2 + 2:
+                    cluster.append(food2)
+                if len(cluster) == 4:
+                    environment.create_food(food1.pos, food1.radius * 2)
+                    for food in cluster:
+                        environment.energy_reserve += food.energy
+                        food.kill()
+                    return True
+    return False
+
+def bench_merge(num_food=300, num_clusters=40):
+    print('food merging: one merge per pairwise scan vs every merge in one grid pass')
+    def create_clusters():
+        # food scattered at random with clusters that can merge
+        seed(0)
+        environment = create_world(0, 0)
+        for _ in range(num_food):
+            environment.create_food((randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)), choice([1, 2, 4, 8]))
+        add_food_clusters(environment, num_clusters)
+        environment.energy_reserve = 0
+        return environment
+    def merge_all(environment, merge):
+        start = time.perf_counter()
+        passes = 0
+        while merge():
+            passes += 1
+        return time.perf_counter() - start, passes
+    reference = create_clusters()
+    reference_time, reference_passes = merge_all(reference, lambda: reference_merge_one_food(reference))
+    grid = create_clusters()
+    grid_time, grid_passes = merge_all(grid, grid.merge_food)
+    print('food:', len(create_clusters().food_group),
+          '\treference: ' + "{:.4f}".format(reference_time) + 's (' + str(reference_passes) + ' passes)',
+          '\tgrid: ' + "{:.4f}".format(grid_time) + 's (' + str(grid_passes) + ' passes)',
+          '\tfood left:', len(reference.food_group), '/', len(grid.food_group),
+          '\tenergy reserve:', "{:.1f}".format(reference.energy_reserve), '/', "{:.1f}".format(grid.energy_reserve))
+
+def bench_draw(num_organisms=100, num_food=5000, num_frames=30):
+    print('camera drawing: blit every sprite vs culled batch blits')
+    init_display()
+    seed(0)
+    environment = create_world(num_organisms, num_food, headless=False)
+    sprite_group = environment.sprite_group
+    player = environment.player
+    screen_rect = sprite_group.display_surface.get_rect()
+    def reference():
+        # the camera loop before culling, returning the sprites that land on screen
+        on_screen = []
+        for sprite in sprite_group.sprites():
+            offset_rect = sprite.rect.copy()
+            if offset_rect.centerx - player.rect.centerx > MAP_WIDTH / 2:
+                offset_rect.centerx -= MAP_WIDTH
+            elif offset_rect.centerx - player.rect.centerx < -MAP_WIDTH / 2:
+                offset_rect.centerx += MAP_WIDTH
+            if offset_rect.centery - player.rect.centery > MAP_HEIGHT / 2:
+                offset_rect.centery -= MAP_HEIGHT
+            elif offset_rect.centery - player.rect.centery < -MAP_HEIGHT / 2:
+                offset_rect.centery += MAP_HEIGHT
+            offset_rect.center -= sprite_group.offset
+            sprite_group.display_surface.blit(sprite.image, offset_rect)
+            if offset_rect.colliderect(screen_rect):
+                on_screen.append(sprite)
+        return on_screen
+    def draw_frames(draw):
+        for frame in range(num_frames):
+            # pan the camera across a map edge so wraparound is exercised
+            player.pos.x = (MAP_WIDTH - SCREEN_WIDTH + frame * 64) % MAP_WIDTH
+            player.rect.center = player.pos
+            draw()
+    reference_time = time_function(draw_frames, reference, repeats=1)
+    culled_time = time_function(draw_frames, lambda: sprite_group.custom_draw(player), repeats=1)
+    print('sprites:', len(sprite_group), '\tframes:', num_frames,
+          '\treference: ' + "{:.2f}".format(reference_time / num_frames * 1000) + 'ms/frame',
+          '\tculled: ' + "{:.2f}".format(culled_time / num_frames * 1000) + 'ms/frame',
+          '\ton screen:', len(reference()), '\tdrawn:', sprite_group.num_drawn, '\tculled:', sprite_group.num_culled)
+
+def reference_fitness(neat_instance, organism):
+    # adjusted fitness of one organism against every member of its species, as Neat.calculate_fitness did before
+    # share_fitness
+    organism.fitness_function()
+    adjustment = 0
+    for member in organism.species.population:
+        genomic_similarity = 1 - neat_instance.genomic_distance(organism.genome, member.genome) / COMPAT_THRESHOLD
+        if genomic_similarity > 0:
+            adjustment += genomic_similarity
+    organism.adj_fitness = organism.fitness / adjustment
+
+def bench_distances(sizes=(100, 1000), num_connects=12, num_rounds=5):
+    print('fitness sharing: distance per pair, uncached and cached, vs a distance matrix per species')
+    for num_organisms in sizes:
+        seed(0)
+        environment = create_world(0, 0)
+        for _ in range(num_organisms):
+            genome = create_genome(environment.neat, num_connects)
+            genome.size = INIT_ORGANISM_SIZE
+            genome.strength = INIT_ORGANISM_STRENGTH
+            genome.agility = INIT_ORGANISM_AGILITY
+            environment.create_organism(genome, (randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)))
+        # every organism in one species, the worst case for sharing
+        species = environment.neat.species[0]
+        for organism in environment.population:
+            organism.species = species
+        species.population = dict.fromkeys(environment.population)
+        environment.neat.species = [species]
+        def reproduction_rounds():
+            # the fitness of every organism is recalculated once a second by Environment.reproduce_organisms
+            for _ in range(num_rounds):
+                for organism in environment.population:
+                    reference_fitness(environment.neat, organism)
+        # a cache that holds nothing recalculates every distance
+        environment.neat.distance_cache = neat.Distance_cache(max_size=0)
+        reference_time = time_function(reproduction_rounds, repeats=1)
+        reference = [organism.adj_fitness for organism in environment.population]
+        environment.neat.distance_cache = neat.Distance_cache(max_size=num_organisms**2)
+        cached_time = time_function(reproduction_rounds, repeats=1)
+        matrix_time = time_function(lambda: [environment.neat.share_fitness(environment.population)
+                                             for _ in range(num_rounds)], repeats=1)
+        error = max(abs(organism.adj_fitness - adj_fitness) for organism, adj_fitness in zip(environment.population, reference))
+        print('organisms:', num_organisms,
+              '\tuncached: ' + "{:.1f}".format(reference_time / num_rounds * 1000) + 'ms/round',
+              '\tcached: ' + "{:.1f}".format(cached_time / num_rounds * 1000) + 'ms/round',
+              '\tmatrix: ' + "{:.1f}".format(matrix_time / num_rounds * 1000) + 'ms/round',
+              '\tmax error: ' + "{:.2e}".format(error))
+
+def bench_births(sizes=(10, 100, 1000), num_births=200):
+    print('genome birth: deepcopy and eager network vs clone and lazy network')
+    seed(0)
+    neat_instance = neat.Neat()
+    for num_connects in sizes:
+        genome = create_genome(neat_instance, num_connects)
+        def deepcopy_births():
+            # births before Genome.clone: the network built its connection list and plan as it was created
+            for _ in range(num_births):
+                child = deepcopy(genome)
+                child.connects
+                neat.Network_plan(child)
+        def clone_births():
+            # the plan is still built once, when the network is first evaluated
+            for _ in range(num_births):
+                neat.Neural_network(genome.clone()).update_plan()
+        deepcopy_time = time_function(lambda: [deepcopy(genome) for _ in range(num_births)])
+        clone_time = time_function(lambda: [genome.clone() for _ in range(num_births)])
+        reference_time = time_function(deepcopy_births)
+        birth_time = time_function(clone_births)
+        print('connections:', len(genome.genes), '\tnodes:', len(genome.nodes),
+              '\tdeepcopy: ' + "{:.1f}".format(deepcopy_time / num_births * 1e6) + 'us',
+              '\tclone: ' + "{:.1f}".format(clone_time / num_births * 1e6) + 'us',
+              '\tbirth before: ' + "{:.1f}".format(reference_time / num_births * 1e6) + 'us',
+              '\tbirth after: ' + "{:.1f}".format(birth_time / num_births * 1e6) + 'us',
+              '\tspeedup: ' + "{:.1f}".format(reference_time / birth_time) + 'x')
+
+def bench_breeding(sizes=(100, 1000, 10000), num_pairs=10):
+    print('parent selection: breeding pool vs cumulative fitness sampling')
+    seed(0)
+    neat_instance = neat.Neat()
+    for num_organisms in sizes:
+        organisms = [SimpleNamespace(adj_fitness=uniform(0, 5)) for _ in range(num_organisms)]
+        sum_adj_fitness = sum(organism.adj_fitness for organism in organisms)
+        for organism in organisms:
+            organism.adj_fitness_norm = organism.adj_fitness * 100 / sum_adj_fitness
+        def breeding_pool():
+            # selection before select_parents: a pool rebuilt for every pair, one entry per whole point of
+            # adj_fitness_norm. every organism gets at least one entry so large populations do not empty it
+            for _ in range(num_pairs):
+                pool = []
+                for organism in organisms:
+                    for _ in range(max(1, int(organism.adj_fitness_norm))):
+                        pool.append(organism)
+                parent1 = choice(pool)
+                while parent1 in pool:
+                    pool.remove(parent1)
+                choice(pool)
+        reference_time = time_function(breeding_pool)
+        sampling_time = time_function(neat_instance.select_parents, organisms, num_pairs)
+        print('organisms:', num_organisms, '\tpairs:', num_pairs,
+              '\tpool: ' + "{:.3f}".format(reference_time * 1000) + 'ms',
+              '\tsampling: ' + "{:.3f}".format(sampling_time * 1000) + 'ms',
+              '\tspeedup: ' + "{:.1f}".format(reference_time / sampling_time) + 'x')
+
+def bench_islands(sim_seconds=30, migration_interval=10):
+    # islands run in parallel between migrations, so throughput should grow with islands up to the number of cores
+    print('island model: simulated seconds of all islands per wall second, ' + str(os.cpu_count()) + ' cores')
+    base_throughput = None
+    for num_islands in sorted({1, 2, 4, os.cpu_count()}):
+        islands = Island_model(num_islands, seed=0)
+        throughput = islands.run(sim_seconds, migration_interval, report=False)
+        islands.close()
+        if base_throughput is None:
+            base_throughput = throughput
+        print('islands:', num_islands, '\tsim s / wall s: ' + "{:.1f}".format(throughput),
+              '\tscaling: ' + "{:.1f}".format(throughput / base_throughput) + 'x')
+
+def check_checkpoint(steps=300):
+    # a world saved and restored continues exactly as the original, including once every organism has died
+    print('checkpoint: continuation after save and restore')
+    file_name = os.path.join(tempfile.mkdtemp(), 'check.npz')
+    for extinct in (False, True):
+        seed_all(0)
+        environment = Environment(headless=True)
+        for _ in range(steps):
+            environment.update(HEADLESS_DT)
+        if extinct:
+            for organism in list(environment.population):
+                environment.remove_organism(organism)
+        save_checkpoint(environment, file_name)
+        for _ in range(steps):
+            environment.update(HEADLESS_DT)
+        original_state = world_state(environment)
+        # restoring also restores the random number generators, so the restored world draws the same numbers
+        restored = load_checkpoint(file_name, headless=True)
+        for _ in range(steps):
+            restored.update(HEADLESS_DT)
+        print('organisms:', len(environment.population), '\tspecies:', len(environment.neat.species),
+              '\tidentical continuation:', original_state == world_state(restored))
+    os.remove(file_name)
+
+def world_state(environment):
+    return (environment.time_elapsed, environment.energy_reserve,
+            [(organism.pos.x, organism.pos.y, organism.energy, organism.species.id) for organism in environment.population],
+            environment.food_system.positions().tolist(), [species.id for species in environment.neat.species],
+            random(), np.random.random())
+
+def resident_memory():
+    # current resident set size in bytes (linux only, 0 elsewhere)
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+def bench_spawn(num_organisms=200):
+    print('organism spawn: loading animations per organism vs shared asset store')
+    init_display()
+    seed(0)
+    neat_instance = neat.Neat()
+    genomes = []
+    for _ in range(num_organisms):
+        genome = neat_instance.create_genome()
+        genome.size = INIT_ORGANISM_SIZE
+        genome.strength = INIT_ORGANISM_STRENGTH
+        genome.agility = INIT_ORGANISM_AGILITY
+        genomes.append(genome)
+    for shared in [True, False]:
+        asset_store.clear()
+        organisms = []
+        memory = resident_memory()
+        start_time = time.perf_counter()
+        for genome in genomes:
+            if not shared:
+                # forget loaded frames so every organism decodes its own copy, as before the asset store
+                asset_store.clear()
+            organisms.append(Organism(genome, [], (randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT))))
+        spawn_time = time.perf_counter() - start_time
+        memory = resident_memory() - memory
+        print('shared assets:', shared, '\torganisms:', num_organisms,
+              '\tspawn: ' + "{:.3f}".format(spawn_time / num_organisms * 1000) + 'ms/organism',
+              '\tmemory: ' + "{:.1f}".format(memory / num_organisms / 1024) + 'kB/organism')
+        del organisms
+
+def calc_position_error(system1, system2):
+    diff = system2.positions() - system1.positions()
+    # minimum-image difference so wrapped particles compare equal
+    diff[:, 0] = (diff[:, 0] + MAP_WIDTH / 2) % MAP_WIDTH - MAP_WIDTH / 2
+    diff[:, 1] = (diff[:, 1] + MAP_HEIGHT / 2) % MAP_HEIGHT - MAP_HEIGHT / 2
+    return np.abs(diff).max()
+
+# benchmark suite: hot paths timed at fixed scales and seeds, saved as json and compared against a baseline
+SUITE_SCALES = {
+    'small': {'organisms': 20, 'food': 200, 'connects': 20},
+    'medium': {'organisms': 100, 'food': 1000, 'connects': 50},
+    'large': {'organisms': 300, 'food': 5000, 'connects': 150},
+}
+SUITE_PATHS = ['move_particles', 'seek', 'get_outputs', 'think', 'genomic_distance', 'crossover', 'merge_food',
+               'custom_draw', 'tick']
+
+def seed_all(value):
+    seed(value)
+    np.random.seed(value)
+
+def time_path(function, setup=None):
+    # time of one call of function(*setup()), leaving setup untimed
+    args = setup() if setup else ()
+    start_time = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start_time
+
+def create_suite_paths(scale, value):
+    # the function (and untimed setup) of every path, on worlds built from the seed
+    init_display()
+    seed_all(value)
+    environment = create_world(scale['organisms'], scale['food'], headless=False)
+    add_food_clusters(environment, scale['food'] // 20)
+    environment.energy_reserve = INIT_ENERGY_RESERVE
+    population = environment.population
+    # genomes grown to the scale's size, each paired with a copy of itself with perturbed weights
+    genomes = [create_genome(environment.neat, scale['connects']) for _ in range(min(len(population), 50))]
+    pairs = []
+    for genome in genomes:
+        relative = genome.clone()
+        relative.modify_weight()
+        pairs.append((SimpleNamespace(genome=genome, adj_fitness=random()), SimpleNamespace(genome=relative, adj_fitness=random())))
+    inputs = np.random.random((len(population), NUM_INPUTS))
+    targets = environment.seek_food()
+    # merging changes the food, so each repeat merges a fresh copy of the same food
+    merge_world = create_world(0, 0)
+    food_state = [(food.pos, food.radius) for food in environment.food_group]
+    def reset_food():
+        for food in merge_world.food_group.sprites():
+            food.kill()
+        merge_world.energy_reserve = float('inf')
+        for pos, radius in food_state:
+            merge_world.create_food(pos, radius)
+        merge_world.energy_reserve = 0
+        return ()
+    def move_particles():
+        move_particle_systems(environment.food_system, environment.food_system, -1000, SIM_DT)
+        move_particle_systems(environment.food_system, environment.dark_matter_system, 1000, SIM_DT)
+        move_particle_systems(environment.dark_matter_system, environment.dark_matter_system, 10000, SIM_DT)
+        move_particle_systems(environment.dark_matter_system, environment.food_system, 10000, SIM_DT)
+    def get_outputs():
+        for organism, organism_inputs in zip(population, inputs):
+            organism.nnet.get_outputs(organism_inputs)
+    def genomic_distance():
+        for genome1, genome2 in zip(genomes, genomes[1:]):
+            neat.calc_genome_comparison(genome1, genome2)
+    def crossover():
+        for parent1, parent2 in pairs:
+            environment.neat.crossover(parent1, parent2)
+    return {
+        'move_particles': (move_particles, None),
+        'seek': (environment.seek_food, None),
+        'get_outputs': (get_outputs, None),
+        'think': (lambda: environment.think(targets), None),
+        'genomic_distance': (genomic_distance, None),
+        'crossover': (crossover, None),
+        'merge_food': (merge_world.merge_food, reset_food),
+        'custom_draw': (lambda: environment.sprite_group.custom_draw(environment.player), None),
+        # last, as ticking moves the world on
+        'tick': (lambda: environment.run(SIM_DT), None),
+    }
+
+def run_suite(scales, seeds, paths, repeats=5):
+    # every world is built first and the suite is then timed in rounds of one call per path and world, so a slow
+    # spell of the machine costs each entry at most a repeat or two rather than all of one entry's repeats. each
+    # entry is the median of its repeats. the first round only warms up
+    worlds = [(scale_name, value, create_suite_paths(SUITE_SCALES[scale_name], value))
+              for scale_name in scales for value in seeds]
+    times = defaultdict(list)
+    for repeat in range(repeats + 1):
+        for scale_name, value, suite_paths in worlds:
+            for path in SUITE_PATHS:
+                if path in paths:
+                    # each path is timed from the same random state
+                    seed_all(value)
+                    function, setup = suite_paths[path]
+                    seconds = time_path(function, setup)
+                    if repeat:
+                        times[(path, scale_name, value)].append(seconds)
+    results = []
+    for (path, scale_name, value), path_times in times.items():
+        seconds = float(np.median(path_times))
+        results.append({'path': path, 'scale': scale_name, 'seed': value, 'seconds': seconds})
+        print(path.ljust(18), scale_name.ljust(8), 'seed:', value, '\t' + "{:.3f}".format(seconds * 1000) + 'ms')
+    return results
+
+def save_suite(results, file_name):
+    suite = {
+        'meta': {'python': platform.python_version(), 'numpy': np.__version__, 'pygame': pygame.version.ver,
+                 'machine': platform.machine(), 'platform': platform.platform(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                 'scales': SUITE_SCALES, 'particle_solver': PARTICLE_SOLVER},
+        'results': results,
+    }
+    with open(file_name, 'w') as file:
+        json.dump(suite, file, indent=2)
+
+def median_times(results):
+    # median over seeds of each (path, scale)
+    times = {}
+    for result in results:
+        times.setdefault((result['path'], result['scale']), []).append(result['seconds'])
+    return {key: float(np.median(seconds)) for key, seconds in times.items()}
+
+def compare_suite(results, file_name, threshold):
+    # prints every path against the baseline and returns the ones slower by more than threshold
+    with open(file_name) as file:
+        baseline = median_times(json.load(file)['results'])
+    regressions = []
+    for key, seconds in median_times(results).items():
+        if key not in baseline:
+            continue
+        change = seconds / baseline[key] - 1
+        flag = ''
+        if change > threshold:
+            flag = 'REGRESSION'
+            regressions.append(key)
+        print(key[0].ljust(18), key[1].ljust(8), 'baseline: ' + "{:.3f}".format(baseline[key] * 1000) + 'ms',
+              '\tcurrent: ' + "{:.3f}".format(seconds * 1000) + 'ms', '\tchange: ' + "{:+.0%}".format(change), flag)
+    print(len(regressions), 'regressions above ' + "{:.0%}".format(threshold))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Wilderness benchmarks')
+    parser.add_argument('benchmarks', nargs='*', default=['particles', 'solver', 'seek', 'networks', 'brains', 'sprites',
+                        'spawn', 'collisions', 'merge', 'draw', 'distances', 'births',
+                        'breeding', 'islands', 'checkpoint'], help='comparisons against reference implementations')
+    parser.add_argument('--suite', action='store_true', help='time the hot paths instead of running comparisons')
+    parser.add_argument('--scales', nargs='+', default=list(SUITE_SCALES), choices=list(SUITE_SCALES))
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0, 1, 2])
+    parser.add_argument('--paths', nargs='+', default=SUITE_PATHS, choices=SUITE_PATHS)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', metavar='FILE', help='save suite results as json')
+    parser.add_argument('--baseline', metavar='FILE', help='compare suite results against saved results')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown flagged as a regression (0.2 = 20%%)')
+    args = parser.parse_args()
+    if args.suite:
+        results = run_suite(args.scales, args.seeds, args.paths, args.repeats)
+        if args.output:
+            save_suite(results, args.output)
+        if args.baseline and compare_suite(results, args.baseline, args.threshold):
+            sys.exit(1)
+        sys.exit()
+    benchmarks = args.benchmarks
+    if 'particles' in benchmarks:
+        check_particles()
+        bench_particles()
+    if 'solver' in benchmarks:
+        check_solver()
+    if 'seek' in benchmarks:
+        bench_seek()
+    if 'networks' in benchmarks:
+        bench_networks()
+    if 'brains' in benchmarks:
+        check_batch()
+        bench_brains()
+    if 'sprites' in benchmarks:
+        bench_sprites()
+    if 'spawn' in benchmarks:
+        bench_spawn()
+    if 'collisions' in benchmarks:
+        bench_collisions()
+    if 'merge' in benchmarks:
+        bench_merge()
+    if 'draw' in benchmarks:
+        bench_draw()
+    if 'distances' in benchmarks:
+        bench_distances()
+    if 'births' in benchmarks:
+        bench_births()
+    if 'breeding' in benchmarks:
+        bench_breeding()
+    if 'islands' in benchmarks:
+        bench_islands()
+    if 'checkpoint' in benchmarks:
+        check_checkpoint()
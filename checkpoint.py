@@ -0,0 +1,259 @@
+import random, gc
+import numpy as np
+import pygame
+from collections import defaultdict
+from neat import Node, Connect, Genome, Species, CONNECT_GENE
+from particles import Particle, Food
+from organism import Organism
+from environment import Environment
+from settings import *
+from config import NUM_OUTPUTS
+
+# a checkpoint is an .npz file of flat arrays: objects are stored as columns and lists of objects (genome nodes and
+# connections, species members) as offsets into flat arrays, so saving and restoring is mostly bulk array copies.
+# bump the version whenever the layout changes
+CHECKPOINT_VERSION = 1
+# organism attributes stored as float columns
+ORGANISM_ATTRIBUTES = ['rotation', 'vel', 'accel', 'force', 'energy', 'energy_loss', 'age', 'food_count', 'offspring',
+                       'fitness', 'adj_fitness', 'frame_index']
+# genome attributes set outside of Genome, stored as nan where missing (the template genome has none)
+GENOME_TRAITS = ['size', 'strength', 'agility']
+
+def save_checkpoint(environment, file_name=CHECKPOINT_FILE):
+    arrays = {'version': np.array(CHECKPOINT_VERSION)}
+    population = environment.population
+    species = environment.neat.species
+
+    # every genome in use: the template, organisms' genomes and species representatives
+    genomes = []
+    genome_index = {}
+    for genome in [environment.neat.init_genome] + [organism.genome for organism in population] + [s.genome for s in species]:
+        if id(genome) not in genome_index:
+            genome_index[id(genome)] = len(genomes)
+            genomes.append(genome)
+    arrays.update(pack_genomes(genomes))
+
+    # organisms
+    organism_index = {id(organism): i for i, organism in enumerate(population)}
+    species_index = {id(s): i for i, s in enumerate(species)}
+    arrays['organism_genome'] = np.array([genome_index[id(organism.genome)] for organism in population], dtype=np.int64)
+    arrays['organism_species'] = np.array([species_index.get(id(getattr(organism, 'species', None)), -1)
+                                           for organism in population], dtype=np.int64)
+    arrays['organism_pos'] = np.array([(organism.pos.x, organism.pos.y) for organism in population]).reshape(-1, 2)
+    arrays['organism_direction'] = np.array([(organism.direction.x, organism.direction.y)
+                                             for organism in population]).reshape(-1, 2)
+    arrays['organism_target'] = np.array([organism.target for organism in population], dtype=float).reshape(-1, 2)
+    arrays['organism_nnet_outputs'] = np.array([organism.nnet_outputs for organism in population],
+                                               dtype=float).reshape(-1, NUM_OUTPUTS)
+    for attribute in ORGANISM_ATTRIBUTES:
+        arrays['organism_' + attribute] = np.array([getattr(organism, attribute) for organism in population], dtype=float)
+    arrays['organism_status'] = np.array([organism.status for organism in population], dtype=str)
+
+    # species, with members as indices into the population
+    arrays['species_id'] = np.array([s.id for s in species], dtype=np.int64)
+    arrays['species_genome'] = np.array([genome_index[id(s.genome)] for s in species], dtype=np.int64)
+    members = [[organism_index[id(organism)] for organism in s.population if id(organism) in organism_index]
+               for s in species]
+    arrays['species_members_start'], arrays['species_members'] = pack_lists(members)
+
+    # particles, in system order
+    for name, system in (('food', environment.food_system), ('dark_matter', environment.dark_matter_system)):
+        arrays[name + '_pos'] = system.positions().copy()
+        arrays[name + '_vel'] = system.velocities().copy()
+        arrays[name + '_radius'] = system.radius[:system.count].copy()
+
+    # environment
+    arrays['time_elapsed'] = np.array(environment.time_elapsed)
+    arrays['food_timer'] = np.array(environment.food_timer)
+    arrays['reprod_timer'] = np.array(environment.reprod_timer)
+    arrays['energy_reserve'] = np.array(environment.energy_reserve)
+    arrays['show_dark_matter'] = np.array(environment.show_dark_matter)
+    if environment.player:
+        arrays['player_pos'] = np.array((environment.player.pos.x, environment.player.pos.y))
+
+    # class-level innovation tables and counters
+    node_keys = [(key, node_id) for key, node_ids in Node.innovations.items() for node_id in node_ids]
+    arrays['node_innovation_keys'] = np.array([key for key, node_id in node_keys], dtype=np.int64).reshape(-1, 2)
+    arrays['node_innovation_ids'] = np.array([node_id for key, node_id in node_keys], dtype=np.int64)
+    arrays['node_id_count'] = np.array(Node.id_count)
+    arrays['connect_innovation_keys'] = np.array(list(Connect.innovations.keys()), dtype=np.int64).reshape(-1, 2)
+    arrays['connect_innovation_ids'] = np.array(list(Connect.innovations.values()), dtype=np.int64)
+    arrays['species_id_count'] = np.array(Species.id)
+
+    # random number generators, so a restored run continues as the saved one would have
+    version, state, gauss_next = random.getstate()
+    arrays['random_state'] = np.array(state, dtype=np.int64)
+    arrays['random_gauss_next'] = np.array(np.nan if gauss_next is None else gauss_next)
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    arrays['numpy_random_keys'] = keys
+    arrays['numpy_random_state'] = np.array((pos, has_gauss, cached_gaussian))
+
+    np.savez_compressed(file_name, **arrays)
+
+def load_checkpoint(file_name=CHECKPOINT_FILE, headless=False):
+    # restoring creates tens of thousands of objects that all stay alive, so collection passes during the load only
+    # cost time
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return restore_checkpoint(file_name, headless)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def restore_checkpoint(file_name, headless):
+    with np.load(file_name, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    if int(arrays['version']) != CHECKPOINT_VERSION:
+        raise ValueError('checkpoint version ' + str(int(arrays['version'])) + ' is not supported (expected ' +
+                         str(CHECKPOINT_VERSION) + ')')
+
+    # class-level tables first, as they are shared by every genome created from here on
+    Node.innovations = defaultdict(list)
+    for key, node_id in zip(map(tuple, arrays['node_innovation_keys'].tolist()), arrays['node_innovation_ids'].tolist()):
+        Node.innovations[key].append(node_id)
+    Node.id_count = int(arrays['node_id_count'])
+    Connect.innovations = dict(zip(map(tuple, arrays['connect_innovation_keys'].tolist()),
+                                   arrays['connect_innovation_ids'].tolist()))
+    Species.id = int(arrays['species_id_count'])
+    genomes = unpack_genomes(arrays)
+
+    environment = Environment(headless, populate=False)
+    environment.time_elapsed = float(arrays['time_elapsed'])
+    environment.food_timer = float(arrays['food_timer'])
+    environment.reprod_timer = float(arrays['reprod_timer'])
+    environment.energy_reserve = float(arrays['energy_reserve'])
+    environment.show_dark_matter = bool(arrays['show_dark_matter'])
+    if environment.player and 'player_pos' in arrays:
+        environment.player.pos.update(arrays['player_pos'].tolist())
+        environment.player.rect.center = environment.player.pos
+
+    # particles are created in system order, then given their exact positions and velocities in bulk
+    food_groups = [environment.sprite_group, environment.food_group]
+    for radius in arrays['food_radius'].astype(int).tolist():
+        Food(food_groups, (0, 0), radius, environment.food_system, headless)
+    dark_matter_groups = [environment.dark_matter_group]
+    if environment.show_dark_matter and not headless:
+        dark_matter_groups.append(environment.sprite_group)
+    for _ in range(len(arrays['dark_matter_pos'])):
+        Particle(dark_matter_groups, (0, 0), environment.dark_matter_system, headless)
+    for name, system in (('food', environment.food_system), ('dark_matter', environment.dark_matter_system)):
+        system.pos[:system.count] = arrays[name + '_pos']
+        system.vel[:system.count] = arrays[name + '_vel']
+        system.version += 1
+
+    # organisms
+    columns = {attribute: arrays['organism_' + attribute].tolist() for attribute in ORGANISM_ATTRIBUTES}
+    organism_groups = [environment.sprite_group, environment.organisms_group]
+    for i, (genome_index, pos, direction, target, status, nnet_outputs) in enumerate(zip(
+            arrays['organism_genome'].tolist(), arrays['organism_pos'].tolist(), arrays['organism_direction'].tolist(),
+            arrays['organism_target'].tolist(), arrays['organism_status'].tolist(), arrays['organism_nnet_outputs'])):
+        organism = Organism(genomes[genome_index], organism_groups, pos, headless)
+        for attribute, column in columns.items():
+            setattr(organism, attribute, column[i])
+        organism.food_count = int(organism.food_count)
+        organism.offspring = int(organism.offspring)
+        organism.pos.update(pos)
+        organism.direction.update(direction)
+        organism.target = tuple(target)
+        organism.status = status
+        organism.nnet_outputs = nnet_outputs
+        organism.update_image()
+        environment.population.append(organism)
+
+    # species
+    for species_id, genome_index, members in zip(arrays['species_id'].tolist(), arrays['species_genome'].tolist(),
+                                                 unpack_lists(arrays['species_members_start'], arrays['species_members'])):
+        species = Species.__new__(Species)
+        species.id = species_id
+        species.genome = genomes[genome_index]
+        species.population = dict.fromkeys(environment.population[i] for i in members)
+        environment.neat.species.append(species)
+    for organism, species_index in zip(environment.population, arrays['organism_species'].tolist()):
+        if species_index >= 0:
+            organism.species = environment.neat.species[species_index]
+    # extinct species, which older checkpoints kept
+    environment.neat.species = [species for species in environment.neat.species if species.population]
+    environment.neat.init_genome = genomes[0]
+
+    # random number generators last, as creating sprites draws from them
+    gauss_next = float(arrays['random_gauss_next'])
+    random.setstate((3, tuple(arrays['random_state'].tolist()), None if np.isnan(gauss_next) else gauss_next))
+    pos, has_gauss, cached_gaussian = arrays['numpy_random_state'].tolist()
+    np.random.set_state(('MT19937', arrays['numpy_random_keys'], int(pos), int(has_gauss), cached_gaussian))
+    return environment
+
+def list_starts(lists):
+    # offsets of each list in the concatenated lists, followed by the total length
+    starts = np.zeros(len(lists) + 1, dtype=np.int64)
+    starts[1:] = np.cumsum([len(values) for values in lists])
+    return starts
+
+def pack_lists(lists):
+    values = np.array([value for values in lists for value in values], dtype=np.int64)
+    return list_starts(lists), values
+
+def unpack_lists(starts, values):
+    values = values.tolist()
+    starts = starts.tolist()
+    return [values[start:end] for start, end in zip(starts, starts[1:])]
+
+def pack_genomes(genomes):
+    arrays = {}
+    nodes = [node for genome in genomes for node in genome.nodes]
+    genes = np.concatenate([genome.genes for genome in genomes])
+    arrays['genome_nodes_start'] = list_starts([genome.nodes for genome in genomes])
+    arrays['genome_connects_start'] = list_starts([genome.genes for genome in genomes])
+    arrays['genome_layers_start'], arrays['genome_layers'] = pack_lists([genome.node_layers for genome in genomes])
+    arrays['genome_version'] = np.array([genome.version for genome in genomes], dtype=np.int64)
+    arrays['genome_first_output_index'] = np.array([genome.first_output_index for genome in genomes], dtype=np.int64)
+    for trait in GENOME_TRAITS:
+        arrays['genome_' + trait] = np.array([getattr(genome, trait, np.nan) for genome in genomes], dtype=float)
+    arrays['node_id'] = np.array([node.id for node in nodes], dtype=np.int64)
+    arrays['node_layer'] = np.array([node.layer for node in nodes], dtype=np.int64)
+    arrays['node_value'] = np.array([node.value for node in nodes], dtype=float)
+    arrays['node_act_function'] = np.array([node.act_function_type for node in nodes], dtype=str)
+    arrays['connect_key'] = np.stack([genes['input'], genes['output']], axis=1).astype(np.int64)
+    arrays['connect_id'] = genes['id'].astype(np.int64)
+    arrays['connect_weight'] = genes['weight']
+    arrays['connect_enabled'] = genes['enabled']
+    return arrays
+
+def unpack_genomes(arrays):
+    # genomes are rebuilt without running the Genome constructor, which would register new innovations
+    nodes = []
+    for node_id, layer, value, act_function_type in zip(arrays['node_id'].tolist(), arrays['node_layer'].tolist(),
+                                                        arrays['node_value'].tolist(), arrays['node_act_function'].tolist()):
+        node = Node(node_id, layer, act_function_type)
+        node.value = value
+        nodes.append(node)
+    genes = np.zeros(len(arrays['connect_id']), dtype=CONNECT_GENE)
+    genes['id'] = arrays['connect_id']
+    genes['input'] = arrays['connect_key'][:, 0]
+    genes['output'] = arrays['connect_key'][:, 1]
+    genes['weight'] = arrays['connect_weight']
+    genes['enabled'] = arrays['connect_enabled']
+    connect_starts = arrays['genome_connects_start']
+    # each genome's genes sorted by innovation, in case they were saved in another order
+    genome_of_gene = np.repeat(np.arange(len(connect_starts) - 1), np.diff(connect_starts))
+    genes = genes[np.lexsort((genes['id'], genome_of_gene))]
+    node_starts = arrays['genome_nodes_start'].tolist()
+    connect_starts = connect_starts.tolist()
+    layers = unpack_lists(arrays['genome_layers_start'], arrays['genome_layers'])
+    traits = {trait: arrays['genome_' + trait].tolist() for trait in GENOME_TRAITS}
+    genomes = []
+    for i, (version, first_output_index) in enumerate(zip(arrays['genome_version'].tolist(),
+                                                          arrays['genome_first_output_index'].tolist())):
+        genome = Genome.__new__(Genome)
+        genome.uid = Genome.new_uid()
+        genome.nodes = nodes[node_starts[i]:node_starts[i + 1]]
+        genome.genes = genes[connect_starts[i]:connect_starts[i + 1]].copy()
+        genome.node_layers = layers[i]
+        genome.version = version
+        genome.first_output_index = first_output_index
+        for trait, column in traits.items():
+            if not np.isnan(column[i]):
+                setattr(genome, trait, column[i])
+        genome.build_indexes()
+        genomes.append(genome)
+    return genomes
@@ -9,16 +9,27 @@ BIAS_ENABLED = True
 
 # activation function
 ACTIVATION_FUNCTION = 'sigmoid'
+ACTIVATION_SLOPES = {'sigmoid': 1, 'mod_sigmoid': 4.9}
+
+# batched inference
+GROUP_CAPACITY = 16 # networks a topology group of Network_batch has room for at first, doubled when full
 
 # genomic compatibility
 C1 = 1
 C2 = 1
 C3 = 0.4
 COMPAT_THRESHOLD = 10
+DISTANCE_CACHE_SIZE = 20000 # max genome pairs whose distance is kept
+# genome a species compares children against: 'founder' (the genome it was founded with), 'oldest' (the oldest
+# member's, refreshed when the representative's organism dies) or 'fittest' (refreshed every reproduction tick)
+SPECIES_REPRESENTATIVE = 'founder'
 
 # crossover
 WEAK_RATIO = 0.5
 
+# parent selection
+SPECIES_QUOTAS = False # share each tick's pairs of parents between species by their total adjusted fitness
+
 # mutations rates
 MUT_ADD_NODE = 0.01
 MUT_REMOVE_NODE = 0.01
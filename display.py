@@ -42,37 +42,93 @@ class Display():
         # select fittest button
         self.select_fittest_width = 120
         self.select_fittest_height = 30
+        self.select_fittest_surface = None
+        # profiler panel
+        self.profiler_width = 275
+        # rendered hud surfaces
+        self.panels = {}
+        self.panel_backgrounds = {}
+        self.text_cache = {}
 
     def global_stats(self, time_elapsed, species, energy_reserve):
-        self.num_lines = 0
-        draw_rect_alpha(self.display_surface, (255, 255, 255, 50), (self.global_stats_x, self.global_stats_y, self.global_stats_width, self.global_stats_height))
-        self.draw_text(self.global_window_pos, 'Global Stats', bold=True)
         time_elapsed = self.format_time(time_elapsed)
-        self.draw_text(self.global_window_pos, 'Time Elapsed: ' + str(time_elapsed[0]) + 'h ' + str(time_elapsed[1]) + 'm ' + str(int(time_elapsed[2])) + 's')
-        self.draw_text(self.global_window_pos, 'No. of Species: ' + str(len(species)))
-        self.draw_text(self.global_window_pos, 'Energy Reserve: ' + str(round(energy_reserve)))
+        lines = ('Time Elapsed: ' + str(time_elapsed[0]) + 'h ' + str(time_elapsed[1]) + 'm ' + str(int(time_elapsed[2])) + 's',
+                 'No. of Species: ' + str(len(species)),
+                 'Energy Reserve: ' + str(round(energy_reserve)))
+        self.draw_panel('global', (self.global_stats_x, self.global_stats_y, self.global_stats_width, self.global_stats_height),
+                        'Global Stats', lines)
 
     def organism_stats(self, selected_organism):
-        self.num_lines = 0
-        draw_rect_alpha(self.display_surface, (255, 255, 255, 50),
-                        (self.org_stats_x, self.org_stats_y, self.org_stats_width, self.org_stats_height))
-        self.draw_text(self.org_window_pos, 'Organism Stats', bold=True)
-        self.draw_text(self.org_window_pos, 'Age: ' + str(int(selected_organism.age)))
-        self.draw_text(self.org_window_pos, 'Energy: ' + str(round(selected_organism.energy)))
-        self.draw_text(self.org_window_pos, 'Fitness: ' + str("{:.2f}".format(selected_organism.fitness)))
-        self.draw_text(self.org_window_pos, 'Adjusted Fitness: ' + str("{:.2f}".format(selected_organism.adj_fitness)))
-        self.draw_text(self.org_window_pos, 'Food Count: ' + str(selected_organism.food_count))
-        self.draw_text(self.org_window_pos, 'Offspring: ' + str(selected_organism.offspring))
-        self.draw_text(self.org_window_pos, 'Size ' + str("{:.2f}".format(selected_organism.size * 50)))
-
-    def draw_text(self, window_pos, string, bold=False):
-        if bold:
-            text = self.stats_font_bold.render(string, True, 'black')
-        else:
-            text = self.stats_font.render(string, True, 'black')
-        self.display_surface.blit(text, (window_pos[0] + 5, window_pos[1] + 5 + self.num_lines * 20))
+        lines = ('Age: ' + str(int(selected_organism.age)),
+                 'Energy: ' + str(round(selected_organism.energy)),
+                 'Fitness: ' + str("{:.2f}".format(selected_organism.fitness)),
+                 'Adjusted Fitness: ' + str("{:.2f}".format(selected_organism.adj_fitness)),
+                 'Food Count: ' + str(selected_organism.food_count),
+                 'Offspring: ' + str(selected_organism.offspring),
+                 'Size ' + str("{:.2f}".format(selected_organism.size * 50)))
+        self.draw_panel('organism', (self.org_stats_x, self.org_stats_y, self.org_stats_width, self.org_stats_height),
+                        'Organism Stats', lines)
+
+    def draw_panel(self, name, rect, title, lines, columns=None):
+        # panels are rendered to a surface that is only rebuilt when their text changes. with columns, the title
+        # and each line are tuples of strings drawn at those x offsets
+        panel = self.panels.get(name)
+        if panel is None or panel[0] != lines:
+            surface = self.panel_background(rect).copy()
+            self.num_lines = 0
+            if columns:
+                self.draw_columns(surface, title, columns, bold=True)
+                for line in lines:
+                    self.draw_columns(surface, line, columns)
+            else:
+                self.draw_text(surface, title, bold=True)
+                for line in lines:
+                    self.draw_text(surface, line)
+            panel = (lines, surface)
+            self.panels[name] = panel
+        self.display_surface.blit(panel[1], rect, special_flags=pygame.BLEND_PREMULTIPLIED)
+        return pygame.Rect(rect)
+
+    def panel_background(self, rect):
+        size = pygame.Rect(rect).size
+        background = self.panel_backgrounds.get(size)
+        if background is None:
+            background = pygame.Surface(size, pygame.SRCALPHA)
+            background.fill((255, 255, 255, 50))
+            background = background.premul_alpha()
+            self.panel_backgrounds[size] = background
+        return background
+
+    def draw_text(self, surface, string, bold=False):
+        surface.blit(self.render_text(string, bold), (5, 5 + self.num_lines * 20), special_flags=pygame.BLEND_PREMULTIPLIED)
         self.num_lines += 1
 
+    def draw_columns(self, surface, strings, columns, bold=False):
+        # right aligned after the first column
+        y = 5 + self.num_lines * 20
+        for i, (string, column) in enumerate(zip(strings, columns)):
+            text = self.render_text(string, bold)
+            if i:
+                surface.blit(text, text.get_rect(topright=(column, y)), special_flags=pygame.BLEND_PREMULTIPLIED)
+            else:
+                surface.blit(text, (column, y), special_flags=pygame.BLEND_PREMULTIPLIED)
+        self.num_lines += 1
+
+    def render_text(self, string, bold=False, colour='black'):
+        key = (string, bold, colour)
+        text = self.text_cache.get(key)
+        if text is None:
+            if len(self.text_cache) >= HUD_CACHE_SIZE:
+                self.text_cache.clear()
+            if bold:
+                text = self.stats_font_bold.render(string, True, colour)
+            else:
+                text = self.stats_font.render(string, True, colour)
+            # hud surfaces are premultiplied so translucent layers composite the same as drawing straight to the screen
+            text = text.convert_alpha().premul_alpha()
+            self.text_cache[key] = text
+        return text
+
     def format_time(self, time_elapsed):
         hours = 0
         minutes = 0
@@ -85,76 +141,76 @@ class Display():
         seconds = time_elapsed
         return hours, minutes, seconds
 
+    def create_graph(self):
+        # axes and labels, drawn once
+        surface = self.panel_background((0, 0, self.graph_width, self.graph_height)).copy()
+        # x axis
+        pygame.draw.line(surface, self.graph_colour, (22, self.graph_height - 20), (self.graph_width - 22, self.graph_height - 20), 1)
+        # y axis - left
+        pygame.draw.line(surface, self.graph_colour, (24, self.graph_height - 20), (24, 20), 1)
+        pygame.draw.line(surface, self.graph_colour, (22, 20), (24, 20), 1)
+        pygame.draw.line(surface, self.graph_colour, (22, self.graph_height // 2), (24, self.graph_height // 2), 1)
+        self.blit_label(surface, str(MAX_FOOD), 'green', (5, 14))
+        self.blit_label(surface, str(MAX_FOOD // 2), 'green', (10, self.graph_height // 2 - 6))
+        self.blit_label(surface, '0', 'green', (15, self.graph_height - 26))
+        self.blit_label(surface, 'Food', 'green', (self.graph_width // 4, 3))
+        # y axis - right
+        pygame.draw.line(surface, self.graph_colour, (self.graph_width - 24, self.graph_height - 20), (self.graph_width - 24, 20), 1)
+        pygame.draw.line(surface, self.graph_colour, (self.graph_width - 24, 20), (self.graph_width - 22, 20), 1)
+        pygame.draw.line(surface, self.graph_colour, (self.graph_width - 24, self.graph_height // 2), (self.graph_width - 22, self.graph_height // 2), 1)
+        self.blit_label(surface, str(MAX_POP_SIZE), 'red', (self.graph_width - 19, 14))
+        self.blit_label(surface, str(MAX_POP_SIZE // 2), 'red', (self.graph_width - 19, self.graph_height // 2 - 6))
+        self.blit_label(surface, '0', 'red', (self.graph_width - 19, self.graph_height - 26))
+        self.blit_label(surface, 'Population', 'red', (3 * self.graph_width // 4 - 30, 3))
+        self.graph_background = surface
+        # data points, scrolled left one pixel per point once full
+        self.plot_surface = pygame.Surface((self.graph_width - 50, self.graph_height), pygame.SRCALPHA)
+        self.graph_surface = None
+
+    def blit_label(self, surface, string, colour, pos):
+        surface.blit(self.graph_font.render(string, True, colour).convert_alpha().premul_alpha(), pos, special_flags=pygame.BLEND_PREMULTIPLIED)
+
     def graph(self, inputs):
         if self.graph_empty:
             self.plot_list = deque([])
+            self.create_graph()
             self.graph_empty = False
         if self.graph_update_count % self.graph_timescale == 0:
             self.plot_list.append(inputs)
             if len(self.plot_list) > self.graph_width - 50:
                 self.plot_list.popleft()
+                self.plot_surface.scroll(-1, 0)
+                self.plot_surface.fill((0, 0, 0, 0), (self.graph_width - 51, 0, 1, self.graph_height))
+            self.plot(len(self.plot_list) - 1, inputs)
+            self.graph_surface = None
         if self.show_display:
-            # draw graph
-            draw_rect_alpha(self.display_surface, (255, 255, 255, 50), (self.graph_x, self.graph_y, self.graph_width, self.graph_height))
-            # x axis
-            pygame.draw.line(self.display_surface, self.graph_colour,
-                             (self.graph_x + 22, self.graph_height + self.graph_y - 20),
-                             (self.graph_x + self.graph_width - 22, self.graph_height + self.graph_y - 20), 1)
-            # y axis - left
-            pygame.draw.line(self.display_surface, self.graph_colour,
-                             (self.graph_x + 24, self.graph_height + self.graph_y - 20),
-                             (self.graph_x + 24, self.graph_y + 20), 1)
-            pygame.draw.line(self.display_surface, self.graph_colour,
-                             (self.graph_x + 22, self.graph_y + 20),
-                             (self.graph_x + 24, self.graph_y + 20), 1)
-            pygame.draw.line(self.display_surface, self.graph_colour,
-                             (self.graph_x + 22, self.graph_height // 2 + self.graph_y),
-                             (self.graph_x + 24, self.graph_height // 2 + self.graph_y), 1)
-            text = self.graph_font.render(str(MAX_FOOD), True, 'green')
-            self.display_surface.blit(text, (self.graph_x + 5, self.graph_y + 14))
-            text = self.graph_font.render(str(MAX_FOOD // 2), True, 'green')
-            self.display_surface.blit(text, (self.graph_x + 10, self.graph_height // 2 + self.graph_y - 6))
-            text = self.graph_font.render('0', True, 'green')
-            self.display_surface.blit(text, (self.graph_x + 15, self.graph_height + self.graph_y - 26))
-            text = self.graph_font.render('Food', True, 'green')
-            self.display_surface.blit(text, (self.graph_x + self.graph_width // 4, self.graph_y + 3))
-            # y axis - right
-            pygame.draw.line(self.display_surface, self.graph_colour,
-                             (self.graph_x + self.graph_width - 24, self.graph_height + self.graph_y - 20),
-                             (self.graph_x + self.graph_width - 24, self.graph_y + 20), 1)
-            pygame.draw.line(self.display_surface, self.graph_colour,
-                             (self.graph_x + self.graph_width - 24, self.graph_y + 20),
-                             (self.graph_x + self.graph_width - 22, self.graph_y + 20), 1)
-            pygame.draw.line(self.display_surface, self.graph_colour,
-                             (self.graph_x + self.graph_width - 24, self.graph_height // 2 + self.graph_y),
-                             (self.graph_x + self.graph_width - 22, self.graph_height // 2 + self.graph_y), 1)
-            text = self.graph_font.render(str(MAX_POP_SIZE), True, 'red')
-            self.display_surface.blit(text, (self.graph_x + self.graph_width - 19, self.graph_y + 14))
-            text = self.graph_font.render(str(MAX_POP_SIZE // 2), True, 'red')
-            self.display_surface.blit(text, (self.graph_x + self.graph_width - 19, self.graph_height // 2 + self.graph_y - 6))
-            text = self.graph_font.render('0', True, 'red')
-            self.display_surface.blit(text, (self.graph_x + self.graph_width - 19, self.graph_height + self.graph_y - 26))
-            text = self.graph_font.render('Population', True, 'red')
-            self.display_surface.blit(text, (self.graph_x + 3 * self.graph_width // 4 - 30, self.graph_y + 3))
-            # plot data
-            for i, data_list in enumerate(self.plot_list):
-                x = self.graph_x + 25 + i
-                for k, data in enumerate(data_list):
-                    if k == 0:
-                        colour = (255, 0, 0)
-                        y = self.graph_height + self.graph_y - 20 - int((data / MAX_POP_SIZE) * (self.graph_height - 40))
-                    else:
-                        colour = (0, 255, 0)
-                        y = self.graph_height + self.graph_y - 20 - int((data / MAX_FOOD) * (self.graph_height - 40))
-                    pygame.draw.rect(self.display_surface, colour, pygame.Rect(x, y, 1, 1))
+            if self.graph_surface is None:
+                self.graph_surface = self.graph_background.copy()
+                self.graph_surface.blit(self.plot_surface, (25, 0), special_flags=pygame.BLEND_PREMULTIPLIED)
+            self.display_surface.blit(self.graph_surface, (self.graph_x, self.graph_y), special_flags=pygame.BLEND_PREMULTIPLIED)
         self.graph_update_count += 1
 
+    def plot(self, x, data_list):
+        for k, data in enumerate(data_list):
+            if k == 0:
+                colour = (255, 0, 0)
+                y = self.graph_height - 20 - int((data / MAX_POP_SIZE) * (self.graph_height - 40))
+            else:
+                colour = (0, 255, 0)
+                y = self.graph_height - 20 - int((data / MAX_FOOD) * (self.graph_height - 40))
+            self.plot_surface.set_at((x, y), colour)
+
     def select_fittest(self):
-        self.num_lines = 0
-        draw_rect_alpha(self.display_surface, (255, 255, 255, 100),
-                        (self.org_stats_x, self.org_stats_y, self.select_fittest_width, self.select_fittest_height))
-        pygame.draw.rect(self.display_surface, 'white', (self.org_stats_x, self.org_stats_y, self.select_fittest_width, self.select_fittest_height), 1)
-        self.draw_text(self.org_window_pos, 'SHOW FITTEST', bold=True)
+        if self.select_fittest_surface is None:
+            rect = (0, 0, self.select_fittest_width, self.select_fittest_height)
+            surface = pygame.Surface((self.select_fittest_width, self.select_fittest_height), pygame.SRCALPHA)
+            surface.fill((255, 255, 255, 100))
+            surface = surface.premul_alpha()
+            pygame.draw.rect(surface, 'white', rect, 1)
+            self.num_lines = 0
+            self.draw_text(surface, 'SHOW FITTEST', bold=True)
+            self.select_fittest_surface = surface
+        self.display_surface.blit(self.select_fittest_surface, self.org_window_pos, special_flags=pygame.BLEND_PREMULTIPLIED)
 
     def update(self, time_elapsed, selected_organism, num_food, population, species, energy_reserve):
         if selected_organism and self.show_display:
@@ -168,13 +224,33 @@ class Display():
             else:
                 self.select_fittest()
 
-def draw_rect_alpha(surface, color, rect):
-    shape_surf = pygame.Surface(pygame.Rect(rect).size, pygame.SRCALPHA)
-    pygame.draw.rect(shape_surf, color, shape_surf.get_rect())
-    surface.blit(shape_surf, rect)
+    def profiler_stats(self, stats):
+        # p50, p95 and max milliseconds of each phase, in the top right corner under the draw counts
+        lines = tuple((phase,) + tuple("{:.2f}".format(time) for time in times) for phase, times in stats.items())
+        rect = (SCREEN_WIDTH - self.profiler_width - self.spacer, self.spacer * 4, self.profiler_width, 10 + 20 * (len(lines) + 1))
+        return self.draw_panel('profiler', rect, ('Phase (ms)', 'p50', 'p95', 'max'), lines, columns=(5, 145, 205, 265))
+
+    def draw_counts(self, num_drawn, num_culled):
+        # sprites drawn vs culled this frame, in the top right corner. returns the area drawn over
+        text = self.render_text('Drawn: ' + str(num_drawn) + '  Culled: ' + str(num_culled), colour='white')
+        rect = text.get_rect(topright=(SCREEN_WIDTH - self.spacer, self.spacer))
+        self.display_surface.blit(text, rect, special_flags=pygame.BLEND_PREMULTIPLIED)
+        return rect
+
+# translucent shapes drawn so far, reused while the same shape is drawn again
+alpha_shapes = {}
 
 def draw_circle_alpha(surface, color, pos, radius, width):
-    rect = (pos[0] - radius, pos[1] - radius, 2 * radius, 2 * radius)
-    shape_surf = pygame.Surface(pygame.Rect(rect).size, pygame.SRCALPHA)
-    pygame.draw.circle(shape_surf, color, shape_surf.get_rect().center, radius, width)
-    surface.blit(shape_surf, rect)
\ No newline at end of file
+    rect = pygame.Rect(pos[0] - radius, pos[1] - radius, 2 * radius, 2 * radius)
+    key = ('circle', tuple(color), radius, width)
+    shape_surf = alpha_shapes.get(key)
+    if shape_surf is None:
+        shape_surf = pygame.Surface(rect.size, pygame.SRCALPHA)
+        pygame.draw.circle(shape_surf, color, shape_surf.get_rect().center, radius, width)
+        cache_alpha_shape(key, shape_surf)
+    surface.blit(shape_surf, rect)
+
+def cache_alpha_shape(key, shape_surf):
+    if len(alpha_shapes) >= HUD_CACHE_SIZE:
+        alpha_shapes.clear()
+    alpha_shapes[key] = shape_surf
\ No newline at end of file
@@ -1,17 +1,28 @@
-import pygame, neat
-from random import randint, uniform, random, choice
-from particles import Particle, Food, move_particles
+import pygame, neat, math
+import numpy as np
+from random import randint, uniform, random
+from particles import Particle, Particle_system, Food, move_particle_systems
 from organism import Organism
 from player import Player
+from spatial import Spatial_grid
 from display import Display
-from support import calc_mag, calc_diff
+from profiler import Profiler
+from support import calc_angle, wrap_diffs
 from settings import *
 
 class Environment:
-    def __init__(self):
-        self.display_surface = pygame.display.get_surface()
+    def __init__(self, headless=False, populate=True):
+        # headless environments skip all drawing, fonts, images and masks. unpopulated environments start without
+        # food, dark matter or organisms, for restoring checkpoints into
+        self.headless = headless
+        if self.headless:
+            self.display_surface = None
+            self.display = None
+        else:
+            self.display_surface = pygame.display.get_surface()
+            self.display = Display()
         self.neat = neat.Neat()
-        self.display = Display()
+        self.brains = neat.Network_batch()
         self.population = []
         self.time_elapsed = 0
         self.food_timer = 0
@@ -19,76 +30,184 @@ class Environment:
         self.energy_reserve = INIT_ENERGY_RESERVE
         self.selected_organism = None
         self.show_dark_matter = True
+        self.profiler = Profiler(['draw', 'hud', 'particles', 'seek', 'think', 'sprites', 'eat', 'energy', 'kill',
+                                  'reproduce', 'food'])
+        self.show_draw_counts = SHOW_DRAW_COUNTS
+        # screen areas changed by the last draw, or None if the whole screen was redrawn
+        self.dirty_rects = None
+        self.redraw_screen = True
+
+        # particle systems
+        self.food_system = Particle_system()
+        self.dark_matter_system = Particle_system()
+        self.food_grid = Spatial_grid(self.food_system)
 
         # sprite group setup
-        self.sprite_group = CameraGroup()
+        self.sprite_group = CameraGroup([self.food_system, self.dark_matter_system])
         self.player_group = pygame.sprite.Group()
         self.organisms_group = pygame.sprite.Group()
         self.food_group = pygame.sprite.Group()
         self.dark_matter_group = pygame.sprite.Group()
 
-        # create food
-        for i in range(INIT_NUM_FOOD):
-            if self.create_food((randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)), 1) == False:
-                break
+        if populate:
+            # create food
+            for i in range(INIT_NUM_FOOD):
+                if self.create_food((randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)), 1) == False:
+                    break
 
-        # create dark matter
-        for i in range(NUM_DARK_MATTER):
-            new_dark_matter = Particle([self.dark_matter_group], (randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)))
-            if self.show_dark_matter:
-                self.sprite_group.add(new_dark_matter)
+            # create dark matter
+            for i in range(NUM_DARK_MATTER):
+                new_dark_matter = Particle([self.dark_matter_group], (randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)), self.dark_matter_system, self.headless)
+                if self.show_dark_matter and not self.headless:
+                    self.sprite_group.add(new_dark_matter)
 
         # create player
-        self.player = Player([self.sprite_group, self.player_group], (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2), self.food_group)
+        if self.headless:
+            self.player = None
+        else:
+            self.player = Player([self.sprite_group, self.player_group], (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2), self.food_group)
 
-        # create population
-        for _ in range(INIT_POP_SIZE):
-            new_genome = self.neat.create_genome()
-            new_genome.size = INIT_ORGANISM_SIZE
-            new_genome.strength = INIT_ORGANISM_STRENGTH
-            new_genome.agility = INIT_ORGANISM_AGILITY
-            if self.create_organism(new_genome, (randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT))) == False:
-                break
+        if populate:
+            # create population
+            for _ in range(INIT_POP_SIZE):
+                new_genome = self.neat.create_genome()
+                new_genome.size = INIT_ORGANISM_SIZE
+                new_genome.strength = INIT_ORGANISM_STRENGTH
+                new_genome.agility = INIT_ORGANISM_AGILITY
+                if self.create_organism(new_genome, (randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT))) == False:
+                    break
 
     def run(self, dt):
-        # draw
-        self.display_surface.fill([0, 10, 50])
-        self.sprite_group.custom_draw(self.player)
+        if not self.headless:
+            self.draw()
+        self.update(dt)
+
+    def draw(self):
+        self.profiler.begin()
+        # the whole screen is redrawn while the hud or profiler is shown and on the frame after, to clear it
+        show_hud = self.display.show_display or self.profiler.enabled
+        full_redraw = not self.sprite_group.use_dirty_rects or show_hud or self.redraw_screen
+        self.redraw_screen = show_hud
+        if full_redraw:
+            self.display_surface.fill(BACKGROUND_COLOUR)
+        dirty_rects = self.sprite_group.custom_draw(self.player, clear=not full_redraw)
+        self.profiler.mark('draw')
         self.display.update(self.time_elapsed, self.selected_organism, len(self.food_group), self.population,
                             self.neat.species, self.energy_reserve)
-        # update
+        if self.profiler.enabled:
+            self.display.profiler_stats(self.profiler.calc_stats())
+        self.profiler.mark('hud')
+        if self.show_draw_counts:
+            counts_rect = self.display.draw_counts(self.sprite_group.num_drawn, self.sprite_group.num_culled)
+            self.sprite_group.prev_rects.append(counts_rect)
+            dirty_rects.append(counts_rect)
+        if full_redraw:
+            self.dirty_rects = None
+        else:
+            self.dirty_rects = dirty_rects
+
+    def update(self, dt):
+        profiler = self.profiler
+        profiler.begin()
         self.update_particles(dt)
+        profiler.mark('particles')
+        targets = self.seek_food()
+        profiler.mark('seek')
+        self.think(targets)
+        profiler.mark('think')
         self.sprite_group.update(dt)
+        profiler.mark('sprites')
+        self.eat_food()
+        profiler.mark('eat')
         for organism in self.organisms_group:
             self.energy_reserve += organism.update_energy()
+        profiler.mark('energy')
         self.kill_organisms()
+        profiler.mark('kill')
         self.reproduce_organisms()
+        profiler.mark('reproduce')
         self.reproduce_food()
+        profiler.mark('food')
         self.time_elapsed += dt
         # deselect
         if self.selected_organism:
             if self.selected_organism.alive == False:
                 self.selected_organism = None
+        profiler.end()
 
     def update_particles(self, dt):
         # food movement
-        move_particles(self.food_group, self.food_group, -1000, dt) # -1000
-        move_particles(self.food_group, self.dark_matter_group, 1000, dt) # 1000
+        move_particle_systems(self.food_system, self.food_system, -1000, dt) # -1000
+        move_particle_systems(self.food_system, self.dark_matter_system, 1000, dt) # 1000
         # dark matter movement
-        move_particles(self.dark_matter_group, self.dark_matter_group, 10000, dt) # 10000
-        move_particles(self.dark_matter_group, self.food_group, 10000, dt) # 10000
+        move_particle_systems(self.dark_matter_system, self.dark_matter_system, 10000, dt) # 10000
+        move_particle_systems(self.dark_matter_system, self.food_system, 10000, dt) # 10000
         # merge food into larger food
-        if self.merge_food():
-            # reset dark matter
-            for dark_matter in self.dark_matter_group:
-                dark_matter.kill()
-            for i in range(NUM_DARK_MATTER):
-                new_dark_matter = Particle([self.dark_matter_group], (randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)))
-                if self.show_dark_matter:
-                    self.sprite_group.add(new_dark_matter)
+        num_merges = self.merge_food()
+        if num_merges:
+            if MERGE_RESET_DARK_MATTER == 'merge':
+                for _ in range(num_merges):
+                    self.reset_dark_matter()
+            else:
+                self.reset_dark_matter()
+
+    def reset_dark_matter(self):
+        for dark_matter in self.dark_matter_group:
+            dark_matter.kill()
+        for i in range(NUM_DARK_MATTER):
+            new_dark_matter = Particle([self.dark_matter_group], (randint(0, MAP_WIDTH), randint(0, MAP_HEIGHT)), self.dark_matter_system, self.headless)
+            if self.show_dark_matter and not self.headless:
+                self.sprite_group.add(new_dark_matter)
+
+    def seek_food(self):
+        # nearest edible food (distance and angle relative to heading) for the whole population in one query
+        targets = np.zeros((len(self.population), 2))
+        if self.population:
+            pos = np.array([(organism.pos.x, organism.pos.y) for organism in self.population])
+            max_radius = np.array([organism.size * 8 for organism in self.population])
+            r, dx, dy = self.food_grid.nearest(pos, max_radius)
+            heading = np.array([calc_angle(organism.direction) for organism in self.population])
+            phi = np.degrees(np.arctan2(dy, dx)) - heading
+            phi[phi > 180] -= 360
+            phi[phi < -180] += 360
+            # as in Organism.seek, organisms with no edible food get R_NORM + 1 and the angle of a zero vector
+            r[r == np.inf] = R_NORM + 1
+            for organism, target in zip(self.population, zip(r.tolist(), phi.tolist())):
+                organism.target = target
+            targets[:, 0] = r
+            targets[:, 1] = phi
+        return targets
+
+    def think(self, targets):
+        # evaluate the networks of the whole population together and hand each organism its outputs
+        if self.population:
+            outputs = self.brains.evaluate([organism.nnet for organism in self.population], targets)
+            for organism, nnet_outputs in zip(self.population, outputs):
+                organism.nnet_outputs = nnet_outputs
+
+    def eat_food(self):
+        # circle broad phase on the food grid, then (optionally) the pixel-perfect mask test on the few candidates.
+        # organisms eat in population order, as they did when each ate during its own update
+        if self.population:
+            use_masks = COLLISION_MASK and not self.headless
+            pos = np.array([(organism.pos.x, organism.pos.y) for organism in self.population])
+            if use_masks:
+                # circles enclosing the rotated organism images, so no mask overlap is missed
+                radii = np.array([math.hypot(organism.rect.width, organism.rect.height) / 2 + 1
+                                  for organism in self.population])
+            else:
+                radii = np.array([organism.radius for organism in self.population])
+            organisms, foods = self.food_grid.overlaps(pos, radii)
+            food_sprites = self.food_grid.sprites
+            for organism_index, food_index in zip(organisms.tolist(), foods.tolist()):
+                organism = self.population[organism_index]
+                food = food_sprites[food_index]
+                if food.alive():
+                    if use_masks == False or pygame.sprite.collide_mask(organism, food):
+                        organism.eat(food)
 
     def create_organism(self, genome, pos):
-        new_organism = Organism(genome, [self.sprite_group, self.organisms_group], pos, self.food_group)
+        new_organism = Organism(genome, [self.sprite_group, self.organisms_group], pos, self.headless)
         if self.energy_reserve >= new_organism.energy:
             self.neat.determine_species(new_organism)
             self.population.append(new_organism)
@@ -101,46 +220,40 @@ class Environment:
     def kill_organisms(self):
         for organism in self.organisms_group:
             if organism.energy <= 0:
-                organism.alive = False
-                self.neat.kill(organism)
-                organism.kill()
-                self.population.remove(organism)
+                self.remove_organism(organism)
+
+    def remove_organism(self, organism):
+        organism.alive = False
+        self.neat.kill(organism)
+        organism.kill()
+        self.population.remove(organism)
 
     def reproduce_organisms(self):
         if self.time_elapsed - self.reprod_timer > 1 and len(self.population) >= 2:
             self.reprod_timer = self.time_elapsed
             if len(self.population) < MAX_POP_SIZE:
-                sum_adj_fitness = 0
-                breeding_pool = []
-                for organism in self.organisms_group:
-                    self.neat.calculate_fitness(organism)
-                    sum_adj_fitness += organism.adj_fitness
-                for organism in self.organisms_group:
-                    organism.adj_fitness_norm = organism.adj_fitness * 100 / sum_adj_fitness
-                    for _ in range(int(organism.adj_fitness_norm)):
-                        breeding_pool.append(organism)
-                parent1 = choice(breeding_pool)
-                parent1_removed = False
-                while parent1_removed == False:
-                    if parent1 in breeding_pool:
-                        breeding_pool.remove(parent1)
-                    else:
-                        parent1_removed = True
-                parent2 = choice(breeding_pool)
-                for _ in range(2):
-                    new_genome = self.neat.crossover(parent1, parent2)
-                    if new_genome:
-                        new_genome.size = parent1.size + uniform(-0.05, 0.05)
-                        if new_genome.size < MIN_ORGANISM_SIZE:
-                            new_genome.size = MIN_ORGANISM_SIZE
-                        elif new_genome.size > MAX_ORGANISM_SIZE:
-                            new_genome.size = MAX_ORGANISM_SIZE
-                        if self.create_organism(new_genome, (parent1.pos.x + uniform(-10, 10), parent1.pos.y + uniform(-10, 10))):
-                            parent1.offspring += 1
-                            parent2.offspring += 1
+                self.neat.share_fitness(self.organisms_group)
+                # each pair of parents has a litter of crossovers, up to OFFSPRING_PER_TICK in all
+                num_pairs = -(-OFFSPRING_PER_TICK // LITTER_SIZE)
+                num_crossovers = 0
+                for parent1, parent2 in self.neat.select_parents(self.organisms_group, num_pairs):
+                    for _ in range(min(LITTER_SIZE, OFFSPRING_PER_TICK - num_crossovers)):
+                        if len(self.population) >= MAX_POP_SIZE:
+                            return
+                        num_crossovers += 1
+                        new_genome = self.neat.crossover(parent1, parent2)
+                        if new_genome:
+                            new_genome.size = parent1.size + uniform(-0.05, 0.05)
+                            if new_genome.size < MIN_ORGANISM_SIZE:
+                                new_genome.size = MIN_ORGANISM_SIZE
+                            elif new_genome.size > MAX_ORGANISM_SIZE:
+                                new_genome.size = MAX_ORGANISM_SIZE
+                            if self.create_organism(new_genome, (parent1.pos.x + uniform(-10, 10), parent1.pos.y + uniform(-10, 10))):
+                                parent1.offspring += 1
+                                parent2.offspring += 1
 
     def create_food(self, pos, radius):
-        new_food = Food([self.sprite_group, self.food_group], pos, radius)
+        new_food = Food([self.sprite_group, self.food_group], pos, radius, self.food_system, self.headless)
         if self.energy_reserve >= new_food.energy:
             self.energy_reserve -= new_food.energy
             return new_food
@@ -159,29 +272,44 @@ class Environment:
                         break
 
     def merge_food(self):
-        for food1 in self.food_group:
-            if food1.radius == 8:
+        # merge every disjoint cluster of 4 equal-radius food within merging distance in one pass over the food grid.
+        # returns the number of merges
+        self.food_grid.update()
+        pos = self.food_grid.pos
+        radius = self.food_grid.radius
+        # neighbours of every food (including itself) within radius * 2 + 2 of the same radius
+        foods1, foods2 = self.food_grid.overlaps(pos, radius + 2)
+        dx = pos[foods2, 0] - pos[foods1, 0]
+        dy = pos[foods2, 1] - pos[foods1, 1]
+        wrap_diffs(dx, dy)
+        close = ((radius[foods1] == radius[foods2]) & (radius[foods1] != 8)
+                 & (np.sqrt(dx * dx + dy * dy) < radius[foods1] * 2 + 2))
+        foods1 = foods1[close]
+        foods2 = foods2[close]
+        starts = np.searchsorted(foods1, np.arange(len(pos) + 1))
+        candidates = np.flatnonzero(np.diff(starts) >= 4)
+        if len(candidates) == 0:
+            return 0
+        # greedily take the first 4 unmerged neighbours of each food, in food order
+        sprites = self.food_grid.sprites
+        merged = np.zeros(len(pos), dtype=bool)
+        num_merges = 0
+        for food1 in candidates.tolist():
+            if merged[food1]:
                 continue
-            cluster = []
-            for food2 in self.food_group:
-                if food1.radius == food2.radius:
-                    d = calc_diff(food1.pos, food2.pos)
-                    r = calc_mag(d)
-                    if r < food1.radius * 2 + 2:
-                        cluster.append(food2)
-                    if len(cluster) == 4:
-                        self.create_food(food1.pos, food1.radius * 2)
-                        for food in cluster:
-                            self.energy_reserve += food.energy
-                            food.kill()
-                        return True
-                    # debug
-                    elif len(cluster) > 4:
-                        print('merge greater than 4')
-        return False
+            neighbours = foods2[starts[food1]:starts[food1 + 1]]
+            neighbours = neighbours[~merged[neighbours]]
+            if len(neighbours) >= 4:
+                cluster = neighbours[:4]
+                merged[cluster] = True
+                self.create_food(sprites[food1].pos, sprites[food1].radius * 2)
+                for food in cluster.tolist():
+                    self.energy_reserve += sprites[food].energy
+                    sprites[food].kill()
+                num_merges += 1
+        return num_merges
 
     def select_organism(self, mouse_pos):
-        if mouse_pos[0] > self.display.org_stats_x
         selected = False
         x = mouse_pos[0] + self.sprite_group.offset.x
         y = mouse_pos[1] + self.sprite_group.offset.y
@@ -216,27 +344,79 @@ class Environment:
         return total_energy
 
 class CameraGroup(pygame.sprite.Group):
-    def __init__(self):
+    # sprites in the given particle systems are culled against the screen in batch, other sprites one at a time
+    def __init__(self, systems=()):
         super().__init__()
         self.display_surface = pygame.display.get_surface()
         self.offset = pygame.math.Vector2()
+        self.systems = systems
+        self.others = {}
+        self.use_dirty_rects = DIRTY_RECTS
+        self.prev_rects = []
+        self.num_drawn = 0
+        self.num_culled = 0
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        if getattr(sprite, 'system', None) not in self.systems:
+            self.others[sprite] = None
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.others.pop(sprite, None)
 
-    def custom_draw(self, player):
-        self.offset.x = player.rect.centerx - SCREEN_WIDTH / 2
-        self.offset.y = player.rect.centery - SCREEN_HEIGHT / 2
-
-        for sprite in self.sprites():
-            offset_rect = sprite.rect.copy()
-            if offset_rect.centerx - player.rect.centerx > MAP_WIDTH / 2:
-                offset_rect.centerx -= MAP_WIDTH
-            elif offset_rect.centerx - player.rect.centerx < -MAP_WIDTH / 2:
-                offset_rect.centerx += MAP_WIDTH
-            if offset_rect.centery - player.rect.centery > MAP_HEIGHT / 2:
-                offset_rect.centery -= MAP_HEIGHT
-            elif offset_rect.centery - player.rect.centery < -MAP_HEIGHT / 2:
-                offset_rect.centery += MAP_HEIGHT
-            offset_rect.center -= self.offset
-            sprite.camera_pos = offset_rect.center
-            self.display_surface.blit(sprite.image, offset_rect)
+    def custom_draw(self, player, clear=False):
+        # draws every sprite on screen and returns the screen areas that changed. clear fills the areas drawn
+        # last frame with the background first, for when the screen is not redrawn in full
+        center_x, center_y = player.rect.center
+        self.offset.x = center_x - SCREEN_WIDTH / 2
+        self.offset.y = center_y - SCREEN_HEIGHT / 2
+
+        blits = []
+        for system in self.systems:
+            if system.count == 0:
+                continue
+            # minimum-image offsets from the player, with a margin for rounding and image size
+            pos = system.positions()
+            dx = pos[:, 0] - center_x
+            dy = pos[:, 1] - center_y
+            wrap_diffs(dx, dy)
+            margin = system.radius[:system.count] + 2
+            visible = np.flatnonzero((np.abs(dx) <= SCREEN_WIDTH / 2 + margin) & (np.abs(dy) <= SCREEN_HEIGHT / 2 + margin))
+            for index in visible.tolist():
+                sprite = system.sprites[index]
+                if sprite in self.spritedict:
+                    blits.append((sprite.image, self.camera_rect(sprite, center_x, center_y)))
+        for sprite in self.others:
+            rect = sprite.rect
+            dx = (rect.centerx - center_x + MAP_WIDTH / 2) % MAP_WIDTH - MAP_WIDTH / 2
+            dy = (rect.centery - center_y + MAP_HEIGHT / 2) % MAP_HEIGHT - MAP_HEIGHT / 2
+            if abs(dx) * 2 > SCREEN_WIDTH + rect.width or abs(dy) * 2 > SCREEN_HEIGHT + rect.height:
+                # off screen, but the selected organism's highlight still follows it
+                sprite.camera_pos = (round(dx + SCREEN_WIDTH / 2), round(dy + SCREEN_HEIGHT / 2))
+                continue
+            blits.append((sprite.image, self.camera_rect(sprite, center_x, center_y)))
+        self.num_drawn = len(blits)
+        self.num_culled = len(self.spritedict) - self.num_drawn
 
+        if clear:
+            for rect in self.prev_rects:
+                self.display_surface.fill(BACKGROUND_COLOUR, rect)
+        drawn_rects = self.display_surface.blits(blits)
+        dirty_rects = self.prev_rects + drawn_rects
+        self.prev_rects = drawn_rects
+        return dirty_rects
 
+    def camera_rect(self, sprite, center_x, center_y):
+        offset_rect = sprite.rect.copy()
+        if offset_rect.centerx - center_x > MAP_WIDTH / 2:
+            offset_rect.centerx -= MAP_WIDTH
+        elif offset_rect.centerx - center_x < -MAP_WIDTH / 2:
+            offset_rect.centerx += MAP_WIDTH
+        if offset_rect.centery - center_y > MAP_HEIGHT / 2:
+            offset_rect.centery -= MAP_HEIGHT
+        elif offset_rect.centery - center_y < -MAP_HEIGHT / 2:
+            offset_rect.centery += MAP_HEIGHT
+        offset_rect.center -= self.offset
+        sprite.camera_pos = offset_rect.center
+        return offset_rect
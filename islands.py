@@ -0,0 +1,190 @@
+import random, time, io
+import numpy as np
+from multiprocessing import Process, Pipe
+from neat import Node, Connect
+from environment import Environment
+from checkpoint import save_checkpoint, pack_genomes, unpack_genomes
+from settings import *
+
+# the island model runs several headless environments side by side, one per process, each with its own seed. every
+# MIGRATION_INTERVAL simulated seconds the islands pause and each sends the genomes of its fittest organisms to the
+# next island in a ring, where they replace the weakest organisms.
+# innovation ids are assigned separately by every process, so migrants carry the lineage of their nodes: the
+# connection each node split and which split of that connection it was. the receiving island maps the nodes onto its
+# own ids through the same lineage and looks connections up by their node keys, so a structure that evolved on both
+# islands gets the same innovation ids on both
+
+class Island_model():
+    def __init__(self, num_islands, seed=None):
+        if seed is None:
+            seeds = [random.randrange(2**32) for _ in range(num_islands)]
+        else:
+            seeds = [seed + i for i in range(num_islands)]
+        self.connections = []
+        self.processes = []
+        for island_seed in seeds:
+            connection, island_connection = Pipe()
+            process = Process(target=run_island, args=(island_connection, island_seed), daemon=True)
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+        # migrants waiting to be sent to each island
+        self.packets = [None] * num_islands
+        self.time_elapsed = 0
+
+    def run(self, sim_seconds, migration_interval=MIGRATION_INTERVAL, report=True):
+        # runs every island for sim_seconds more, migrating between them every migration_interval
+        start_time = time.perf_counter()
+        self.start_sim_time = self.time_elapsed
+        end_sim_time = self.start_sim_time + sim_seconds
+        while self.time_elapsed < end_sim_time:
+            epoch = min(migration_interval, end_sim_time - self.time_elapsed)
+            for connection, packet in zip(self.connections, self.packets):
+                connection.send(('run', epoch, packet))
+            replies = [connection.recv() for connection in self.connections]
+            stats = [reply[0] for reply in replies]
+            # each island's emigrants go to the next island. a lone island keeps its own
+            if len(replies) > 1:
+                packets = [reply[1] for reply in replies]
+                self.packets = packets[-1:] + packets[:-1]
+            self.time_elapsed = stats[0]['time']
+            if report:
+                self.report(stats, time.perf_counter() - start_time)
+        wall_time = time.perf_counter() - start_time
+        # simulated seconds of all islands per wall second
+        return len(self.connections) * (self.time_elapsed - self.start_sim_time) / wall_time
+
+    def report(self, stats, wall_time):
+        print('sim time: ' + str(round(self.time_elapsed)) + 's',
+              '\twall time: ' + "{:.1f}".format(wall_time) + 's',
+              '\tisland sim s / wall s: ' + "{:.1f}".format(
+                  len(stats) * (self.time_elapsed - self.start_sim_time) / wall_time),
+              '\tpopulations: ' + ' '.join(str(island['population']) for island in stats),
+              '\tspecies: ' + ' '.join(str(island['species']) for island in stats),
+              '\tbest fitness: ' + "{:.2f}".format(max(island['fitness'] for island in stats)))
+
+    def save(self, file_name):
+        # one checkpoint per island, numbered after the file name
+        for i, connection in enumerate(self.connections):
+            connection.send(('save', island_file_name(file_name, i)))
+        for connection in self.connections:
+            connection.recv()
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
+
+def island_file_name(file_name, index):
+    if file_name.endswith('.npz'):
+        file_name = file_name[:-4]
+    return file_name + '_' + str(index) + '.npz'
+
+def run_island(connection, seed):
+    # worker process: one environment, run and migrated into as the island model asks
+    random.seed(seed)
+    np.random.seed(seed)
+    environment = Environment(headless=True)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        if message[0] == 'run':
+            _, sim_seconds, packet = message
+            if packet:
+                immigrate(environment, unpack_migrants(packet, environment.neat.init_genome))
+            end_sim_time = environment.time_elapsed + sim_seconds
+            while environment.time_elapsed < end_sim_time:
+                environment.update(HEADLESS_DT)
+            fittest = rank_organisms(environment)[:NUM_MIGRANTS]
+            packet = pack_migrants([organism.genome for organism in fittest], environment.neat.init_genome)
+            connection.send((island_stats(environment, fittest), packet))
+        elif message[0] == 'save':
+            save_checkpoint(environment, message[1])
+            connection.send(True)
+    connection.close()
+
+def rank_organisms(environment):
+    # fittest first
+    for organism in environment.population:
+        organism.fitness_function()
+    return sorted(environment.population, key=lambda organism: organism.fitness, reverse=True)
+
+def island_stats(environment, fittest):
+    return {'time': environment.time_elapsed,
+            'population': len(environment.population),
+            'food': len(environment.food_group),
+            'species': len(environment.neat.species),
+            'fitness': fittest[0].fitness if fittest else 0}
+
+def immigrate(environment, genomes):
+    # migrants take the place of the weakest organisms, but at most half of the island's own population is replaced.
+    # replaced organisms' energy goes back to the reserve, which pays for the migrants as for any birth
+    weakest = rank_organisms(environment)[::-1][:len(environment.population) // 2]
+    for genome, organism in zip(genomes, weakest):
+        pos = (organism.pos.x, organism.pos.y)
+        environment.energy_reserve += organism.energy
+        organism.energy = 0
+        environment.remove_organism(organism)
+        environment.create_organism(genome, pos)
+    for genome in genomes[len(weakest):]:
+        if len(environment.population) >= MAX_POP_SIZE:
+            break
+        environment.create_organism(genome, (random.randint(0, MAP_WIDTH), random.randint(0, MAP_HEIGHT)))
+
+def pack_migrants(genomes, init_genome):
+    # genomes in the checkpoint layout, with the lineage of every node they use that is not an initial node. islands
+    # are started from the same config, so their initial nodes have the same ids
+    if not genomes:
+        return None
+    arrays = pack_genomes(genomes)
+    lineages = {node_id: (key, ordinal) for key, node_ids in Node.innovations.items()
+                for ordinal, node_id in enumerate(node_ids)}
+    initial_ids = {node.id for node in init_genome.nodes}
+    # nodes the genomes use and, as a node's lineage names the nodes of the connection it split, their ancestors
+    lineage_ids = set()
+    stack = [node.id for genome in genomes for node in genome.nodes]
+    while stack:
+        node_id = stack.pop()
+        if node_id not in initial_ids and node_id not in lineage_ids:
+            lineage_ids.add(node_id)
+            stack.extend(lineages[node_id][0])
+    lineage_ids = sorted(lineage_ids)
+    arrays['lineage_id'] = np.array(lineage_ids, dtype=np.int64)
+    arrays['lineage_key'] = np.array([lineages[node_id][0] for node_id in lineage_ids], dtype=np.int64).reshape(-1, 2)
+    arrays['lineage_ordinal'] = np.array([lineages[node_id][1] for node_id in lineage_ids], dtype=np.int64)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+def unpack_migrants(packet, init_genome):
+    with np.load(io.BytesIO(packet), allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    genomes = unpack_genomes(arrays)
+    # a node is always created after the nodes of the connection it splits, so in id order every node's key can be
+    # mapped before the node itself. splits this island hasn't seen are registered as new innovations
+    node_map = {node.id: node.id for node in init_genome.nodes}
+    for node_id, key, ordinal in zip(arrays['lineage_id'].tolist(), arrays['lineage_key'].tolist(),
+                                     arrays['lineage_ordinal'].tolist()):
+        node_ids = Node.innovations[(node_map[key[0]], node_map[key[1]])]
+        while len(node_ids) <= ordinal:
+            Node.id_count += 1
+            node_ids.append(Node.id_count)
+        node_map[node_id] = node_ids[ordinal]
+    for genome in genomes:
+        remap_genome(genome, node_map)
+    return genomes
+
+def remap_genome(genome, node_map):
+    # move a genome onto this island's node ids and connection innovations
+    for node in genome.nodes:
+        node.id = node_map[node.id]
+    genes = genome.genes
+    inputs = [node_map[node_id] for node_id in genes['input'].tolist()]
+    outputs = [node_map[node_id] for node_id in genes['output'].tolist()]
+    genes['input'] = inputs
+    genes['output'] = outputs
+    genes['id'] = [Connect.innovation(key) for key in zip(inputs, outputs)]
+    genome.genes = genes[np.argsort(genes['id'], kind='stable')]
+    genome.build_indexes()
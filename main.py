@@ -1,24 +1,36 @@
-import pygame, sys, time
+import pygame, sys, time, argparse, random
+import numpy as np
 from environment import Environment
+from checkpoint import save_checkpoint, load_checkpoint
+from islands import Island_model
 from settings import *
 
 class Simulation():
-    def __init__(self):
+    def __init__(self, checkpoint=None):
         pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption('Wilderness')
         # pygame.mixer.music.load('sounds/background.mp3')
         # pygame.mixer.music.play(-1)
         self.clock = pygame.time.Clock()
-        self.prev_time = time.time()
-        self.environment = Environment()
+        self.prev_time = time.perf_counter()
+        if checkpoint:
+            self.environment = load_checkpoint(checkpoint)
+        else:
+            self.environment = Environment()
         self.sim_active = True
+        # simulated seconds per wall second. the step size is fixed, so speed changes how many steps are run
         self.speed = 1
+        self.accumulator = 0
+        # turbo runs as many steps as fit in each frame budget and only draws occasionally
+        self.turbo = False
+        self.last_render = 0
 
     def run(self):
         while self.sim_active:
-            dt = (time.time() - self.prev_time) * self.speed
-            self.prev_time = time.time()
+            current_time = time.perf_counter()
+            frame_time = current_time - self.prev_time
+            self.prev_time = current_time
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -26,15 +38,144 @@ class Simulation():
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_SPACE:
                         self.environment.display.show_display = not self.environment.display.show_display
+                    if event.key == pygame.K_c:
+                        self.environment.show_draw_counts = not self.environment.show_draw_counts
+                    if event.key == pygame.K_t:
+                        self.toggle_turbo()
+                    if event.key == pygame.K_p:
+                        self.environment.profiler.enabled = not self.environment.profiler.enabled
+                    if event.key == pygame.K_F5:
+                        save_checkpoint(self.environment)
+                    if event.key == pygame.K_F9:
+                        self.load(CHECKPOINT_FILE)
                 if event.type == pygame.MOUSEBUTTONUP:
                     self.environment.select_organism(pygame.mouse.get_pos())
 
-            self.environment.run(dt)
-            pygame.display.update()
-            self.clock.tick(FPS)
+            if self.turbo:
+                deadline = current_time + TURBO_FRAME_BUDGET
+                while time.perf_counter() < deadline:
+                    self.environment.update(SIM_DT)
+                if current_time - self.last_render >= TURBO_RENDER_INTERVAL:
+                    self.last_render = current_time
+                    self.render()
+            else:
+                # fixed steps for the wall time that has passed, dropping any backlog beyond MAX_SUBSTEPS
+                self.accumulator = min(self.accumulator + frame_time * self.speed, MAX_SUBSTEPS * SIM_DT)
+                while self.accumulator >= SIM_DT:
+                    self.environment.update(SIM_DT)
+                    self.accumulator -= SIM_DT
+                self.render()
+                self.clock.tick(FPS)
+        self.environment.profiler.stop_csv()
         pygame.quit()
         sys.exit()
 
+    def render(self):
+        self.environment.draw()
+        pygame.display.update(self.environment.dirty_rects)
+
+    def load(self, checkpoint):
+        # a missing or unreadable checkpoint leaves the current world running
+        try:
+            environment = load_checkpoint(checkpoint)
+        except (OSError, ValueError) as error:
+            print('could not load checkpoint ' + checkpoint + ': ' + str(error))
+            return
+        # the profiler carries over to the restored world
+        environment.profiler = self.environment.profiler
+        self.environment = environment
+        self.accumulator = 0
+
+    def toggle_turbo(self):
+        self.turbo = not self.turbo
+        self.accumulator = 0
+        if self.turbo:
+            pygame.display.set_caption('Wilderness (turbo)')
+        else:
+            pygame.display.set_caption('Wilderness')
+
+class Headless_simulation():
+    def __init__(self, seed=None, checkpoint=None):
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        if checkpoint:
+            self.environment = load_checkpoint(checkpoint, headless=True)
+        else:
+            self.environment = Environment(headless=True)
+        self.dt = HEADLESS_DT
+
+    def run(self, sim_seconds, report_interval=60):
+        # runs for sim_seconds more, so resumed runs continue from the checkpoint's time
+        start_time = time.perf_counter()
+        self.start_sim_time = self.environment.time_elapsed
+        end_sim_time = self.start_sim_time + sim_seconds
+        next_report = self.start_sim_time + report_interval
+        steps = 0
+        reported = False
+        while self.environment.time_elapsed < end_sim_time:
+            self.environment.update(self.dt)
+            steps += 1
+            reported = False
+            if report_interval and self.environment.time_elapsed >= next_report:
+                next_report += report_interval
+                self.report(time.perf_counter() - start_time)
+                reported = True
+        wall_time = time.perf_counter() - start_time
+        # the last interval's report already covers the end of the run
+        if not reported:
+            self.report(wall_time)
+        print('steps:', steps)
+        distance_cache = self.environment.neat.distance_cache
+        print('distance cache hit rate: ' + "{:.2f}".format(distance_cache.hit_rate()),
+              '\thits:', distance_cache.hits, '\tmisses:', distance_cache.misses)
+        profiler = self.environment.profiler
+        profiler.stop_csv()
+        if profiler.enabled:
+            for phase, times in profiler.calc_stats(refresh=0).items():
+                print(phase.ljust(10), '\tp50: ' + "{:.3f}".format(times[0]) + 'ms', '\tp95: ' + "{:.3f}".format(times[1]) + 'ms',
+                      '\tmax: ' + "{:.3f}".format(times[2]) + 'ms')
+        return (self.environment.time_elapsed - self.start_sim_time) / wall_time
+
+    def report(self, wall_time):
+        sim_time = self.environment.time_elapsed
+        print('sim time: ' + str(round(sim_time)) + 's',
+              '\twall time: ' + "{:.1f}".format(wall_time) + 's',
+              '\tsim s / wall s: ' + "{:.1f}".format((sim_time - self.start_sim_time) / wall_time),
+              '\tpopulation: ' + str(len(self.environment.population)),
+              '\tfood: ' + str(len(self.environment.food_group)),
+              '\tspecies: ' + str(len(self.environment.neat.species)))
+
 if __name__ == '__main__':
-    simulation = Simulation()
-    simulation.run()
+    parser = argparse.ArgumentParser(description='Wilderness evolution simulation')
+    parser.add_argument('--headless', type=float, metavar='SECONDS',
+                        help='run without a display for the given number of simulated seconds')
+    parser.add_argument('--seed', type=int, help='seed for random and numpy.random')
+    parser.add_argument('--profile-csv', metavar='FILE', help='enable the tick profiler and stream its samples to a csv file')
+    parser.add_argument('--load', metavar='FILE', help='resume from a checkpoint')
+    parser.add_argument('--save', metavar='FILE', help='save a checkpoint when a headless run finishes')
+    parser.add_argument('--islands', type=int, metavar='K',
+                        help='run K headless environments in parallel processes, migrating genomes between them')
+    args = parser.parse_args()
+    if args.islands:
+        if not args.headless or args.load or args.profile_csv:
+            parser.error('--islands needs --headless and does not support --load or --profile-csv')
+        islands = Island_model(args.islands, args.seed)
+        islands.run(args.headless)
+        if args.save:
+            islands.save(args.save)
+        islands.close()
+        sys.exit()
+    if args.headless:
+        simulation = Headless_simulation(args.seed, args.load)
+    else:
+        simulation = Simulation(args.load)
+    if args.profile_csv:
+        simulation.environment.profiler.enabled = True
+        simulation.environment.profiler.start_csv(args.profile_csv)
+    if args.headless:
+        simulation.run(args.headless)
+        if args.save:
+            save_checkpoint(simulation.environment, args.save)
+    else:
+        simulation.run()
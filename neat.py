@@ -1,7 +1,7 @@
 import numpy as np
-from random import random, randint, uniform
-from copy import copy, deepcopy
-from collections import defaultdict
+from random import random, randint
+from copy import deepcopy
+from collections import defaultdict, OrderedDict
 from config import *
 
 class Node:
@@ -14,10 +14,15 @@ class Node:
         self.input_nodes = []
         self.input_weights = []
         self.act_function_type = act_function_type
-        if self.act_function_type == 'sigmoid':
-            self.activation_function = lambda x: 1 / (1 + np.exp(-1 * x))
-        elif self.act_function_type == 'mod_sigmoid':
-            self.activation_function = lambda x: 1 / (1 + np.exp(-4.9 * x))
+
+    def activation_function(self, x):
+        return 1 / (1 + np.exp(-ACTIVATION_SLOPES[self.act_function_type] * x))
+
+    def copy(self):
+        # the node's gene data without its links, which Neural_network.create_network rebuilds
+        node = Node(self.id, self.layer, self.act_function_type)
+        node.value = self.value
+        return node
 
     def link(self, input_nodes, input_weights):
         # add input nodes and connection weights to node
@@ -41,12 +46,14 @@ class Node:
               '\tvalue:', self.value,
               '\tactivation function:', self.act_function_type)
 
+# a genome's connection genes are kept as rows of one structured array, sorted by innovation id
+CONNECT_GENE = np.dtype([('id', np.int32), ('input', np.int32), ('output', np.int32), ('weight', float), ('enabled', bool)])
+
 class Connect:
     innovations = {}
     def __init__(self, key, weight=None):
         self.key = key
-        # if key exists, use value as ID. otherwise, add key to dictionary and assign unique ID
-        self.id = Connect.innovations.setdefault(self.key, len(Connect.innovations) + 1)
+        self.id = Connect.innovation(key)
         self.input_node = self.key[0]
         self.output_node = self.key[1]
         self.enabled = True
@@ -55,6 +62,23 @@ class Connect:
         else:
             self.weight = random() - 0.5
 
+    @staticmethod
+    def innovation(key):
+        # if key exists, use value as ID. otherwise, add key to dictionary and assign unique ID
+        return Connect.innovations.setdefault(key, len(Connect.innovations) + 1)
+
+    @classmethod
+    def from_gene(cls, id, input_node, output_node, weight, enabled):
+        # a Connect for an existing gene, without registering an innovation
+        connect = cls.__new__(cls)
+        connect.key = (input_node, output_node)
+        connect.id = id
+        connect.input_node = input_node
+        connect.output_node = output_node
+        connect.weight = weight
+        connect.enabled = enabled
+        return connect
+
     def info(self):
         print('connect innov:', self.id,
               '\tinput node:', self.input_node,
@@ -63,9 +87,17 @@ class Connect:
               '\tenabled:', self.enabled)
 
 class Genome:
+    uid_count = 0
     def __init__(self):
+        # unique for every genome, including copies, so cached distances can't be confused between genomes
+        self.uid = Genome.new_uid()
         self.nodes = []
-        self.connects = []
+        self.genes = np.zeros(0, dtype=CONNECT_GENE)
+        # nodes by id and connection innovation ids by (input node, output node), kept up to date by every mutation
+        self.nodes_by_id = {}
+        self.connects_by_key = {}
+        # incremented by every mutation so compiled networks know when to rebuild
+        self.version = 0
         if INIT_CONNECTS == 'unconnected':
             self.init_nodes()
         elif INIT_CONNECTS == 'full_nodirect':
@@ -74,13 +106,60 @@ class Genome:
         self.nodes.sort(key=lambda x: x.layer)
         self.first_output_index = len(self.nodes) - NUM_OUTPUTS
 
+    @staticmethod
+    def new_uid():
+        Genome.uid_count += 1
+        return Genome.uid_count
+
+    def clone(self):
+        # copy of the gene data, including traits set outside of Genome, under a new uid. networks built from the
+        # genome are not copied, as Neural_network builds them when first used
+        genome = Genome.__new__(Genome)
+        genome.__dict__.update(self.__dict__)
+        genome.uid = Genome.new_uid()
+        genome.nodes = [node.copy() for node in self.nodes]
+        genome.genes = self.genes.copy()
+        genome.node_layers = list(self.node_layers)
+        genome.nodes_by_id = {node.id: node for node in genome.nodes}
+        genome.connects_by_key = self.connects_by_key.copy()
+        return genome
+
+    def build_indexes(self):
+        # for genomes whose nodes and genes were set directly
+        self.nodes_by_id = {node.id: node for node in self.nodes}
+        self.connects_by_key = dict(zip(zip(self.genes['input'].tolist(), self.genes['output'].tolist()),
+                                        self.genes['id'].tolist()))
+
+    def __deepcopy__(self, memo):
+        genome = Genome.__new__(Genome)
+        memo[id(self)] = genome
+        for name, value in self.__dict__.items():
+            setattr(genome, name, deepcopy(value, memo))
+        genome.uid = Genome.new_uid()
+        return genome
+
+    @property
+    def connects(self):
+        # connection genes as Connect objects, for the node by node network and the network display. changes to
+        # them are not written back to the genome
+        return [Connect.from_gene(*gene) for gene in self.genes.tolist()]
+
+    def add_gene(self, key, weight=None):
+        # insert a connection gene at its place in innovation order
+        id = Connect.innovation(key)
+        self.connects_by_key[key] = id
+        if not weight:
+            weight = random() - 0.5
+        index = np.searchsorted(self.genes['id'], id)
+        self.genes = np.insert(self.genes, index, np.array((id, key[0], key[1], weight, True), dtype=CONNECT_GENE))
+
     def create_node(self, key, layer):
         new_node_id = 0
         # check if key already exists
         if key in Node.innovations:
             # iterate through IDs in the key and check if existing innovations are not in genome
             for id in Node.innovations.get(key):
-                if find_by_id(id, self.nodes) == False:
+                if id not in self.nodes_by_id:
                     new_node_id = id
                     break
         # if the key is unique or the genome already contains all innovations of existing key, create new ID.
@@ -88,7 +167,9 @@ class Genome:
             Node.id_count += 1
             new_node_id = Node.id_count
             Node.innovations[key].append(new_node_id)
+        # the node is indexed here, so the caller only has to place it in self.nodes
         new_node = Node(new_node_id, layer, ACTIVATION_FUNCTION)
+        self.nodes_by_id[new_node_id] = new_node
         return new_node
 
     def init_nodes(self):
@@ -121,17 +202,14 @@ class Genome:
         if NUM_HIDDEN:
             for i in range(NUM_INPUTS):
                 for h in range(NUM_HIDDEN):
-                    new_connect = Connect((i + 2, NUM_INPUTS + NUM_OUTPUTS + h + 2))
-                    self.connects.append(new_connect)
+                    self.add_gene((i + 2, NUM_INPUTS + NUM_OUTPUTS + h + 2))
             for h in range(NUM_HIDDEN):
                 for o in range(NUM_OUTPUTS):
-                    new_connect = Connect((NUM_INPUTS + NUM_OUTPUTS + h + 2, NUM_INPUTS + o + 2))
-                    self.connects.append(new_connect)
+                    self.add_gene((NUM_INPUTS + NUM_OUTPUTS + h + 2, NUM_INPUTS + o + 2))
         else:
             for i in range(NUM_INPUTS):
                 for o in range(NUM_OUTPUTS):
-                    new_connect = Connect((i + 2, NUM_INPUTS + o + 2))
-                    self.connects.append(new_connect)
+                    self.add_gene((i + 2, NUM_INPUTS + o + 2))
 
     def add_connect(self):
         # calculate total possible connections
@@ -145,69 +223,54 @@ class Genome:
             connects_count += (nodes_to_connect - nodes_in_layer) * nodes_in_layer
             nodes_to_connect -= nodes_in_layer
         # add random connection if possible
-        if len(self.connects) < connects_count:
+        if len(self.genes) < connects_count:
             connect_exists = True
             while connect_exists:
                 # select connection input
                 index = randint(0, self.first_output_index - 1)
                 input_node_id = self.nodes[index].id
                 input_node_layer = self.nodes[index].layer
-                # select connection output in a higher layer
-                for i, node in enumerate(self.nodes):
-                    if node.layer > input_node_layer:
-                        first_index = i
-                        break
+                # select connection output in a higher layer. nodes are sorted by layer, so the first node above
+                # the input's layer follows all nodes in its layer and below
+                first_index = sum(self.node_layers[:input_node_layer + 1])
                 index = randint(first_index, len(self.nodes) - 1)
                 output_node_id = self.nodes[index].id
                 # check connection doesn't already exist
-                connect_exists = False
-                for connect in self.connects:
-                    if connect.key == (input_node_id, output_node_id):
-                        connect_exists = True
+                connect_exists = (input_node_id, output_node_id) in self.connects_by_key
                 # disallow bias connections if not enabled
                 if BIAS_ENABLED == False:
                     if input_node_id == 1:
                         connect_exists = True
-            new_connect = Connect((input_node_id, output_node_id))
-            self.connects.append(new_connect)
+            self.add_gene((input_node_id, output_node_id))
+            self.version += 1
 
     def enable_connect(self):
-        disabled_connects = []
-        # create list of disabled connections
-        for connect in self.connects:
-            if connect.enabled == False:
-                disabled_connects.append(connect)
-        # enable random connection from the list
-        if disabled_connects:
+        # enable random disabled connection
+        disabled_connects = np.flatnonzero(~self.genes['enabled'])
+        if len(disabled_connects):
             index = randint(0, len(disabled_connects) - 1)
-            rand_connect = disabled_connects[index]
-            rand_connect.enabled = True
+            self.genes['enabled'][disabled_connects[index]] = True
+            self.version += 1
 
     def disable_connect(self):
-        enabled_connects = []
-        # create list of enabled connections
-        for connect in self.connects:
-            if connect.enabled:
-                enabled_connects.append(connect)
-        # disable random connection from the list
-        if enabled_connects:
+        # disable random enabled connection
+        enabled_connects = np.flatnonzero(self.genes['enabled'])
+        if len(enabled_connects):
             index = randint(0, len(enabled_connects) - 1)
-            rand_connect = enabled_connects[index]
-            rand_connect.enabled = False
+            self.genes['enabled'][enabled_connects[index]] = False
+            self.version += 1
 
     def add_node(self):
-        enabled_connects = []
-        # create list of enabled connections not connected to bias node
-        for connect in self.connects:
-            if connect.enabled and connect.input_node != 1:
-                enabled_connects.append(connect)
-        if enabled_connects:
-            # select random enabled connection
+        # enabled connections not connected to bias node
+        enabled_connects = np.flatnonzero(self.genes['enabled'] & (self.genes['input'] != 1))
+        if len(enabled_connects):
+            # select random enabled connection and disable it
             index = randint(0, len(enabled_connects) - 1)
-            rand_connect = enabled_connects[index]
+            _, input_node, output_node, weight, _ = self.genes[enabled_connects[index]].tolist()
+            self.genes['enabled'][enabled_connects[index]] = False
             # if layer already exists, add node to random layer. otherwise, create new layer.
-            input_layer = find_by_id(rand_connect.input_node, self.nodes).layer
-            output_layer = find_by_id(rand_connect.output_node, self.nodes).layer
+            input_layer = self.nodes_by_id[input_node].layer
+            output_layer = self.nodes_by_id[output_node].layer
             if output_layer - input_layer > 1:
                 layer = randint(input_layer + 1, output_layer - 1)
                 self.node_layers[layer] += 1
@@ -218,21 +281,16 @@ class Genome:
                 for node in self.nodes:
                     if node.layer >= layer:
                         node.layer += 1
-            # find new node index
-            for i, node in enumerate(self.nodes):
-                if node.layer > layer:
-                    new_node_index = i
-                    break
+            # new node goes last in its layer, which node_layers already counts it in
+            new_node_index = sum(self.node_layers[:layer + 1]) - 1
             # add new node
-            new_node = self.create_node((rand_connect.input_node, rand_connect.output_node), layer)
+            new_node = self.create_node((input_node, output_node), layer)
             self.nodes.insert(new_node_index, new_node)
             self.first_output_index += 1
-            # add new connections and disable existing connection
-            new_connect = Connect((rand_connect.input_node, new_node.id), rand_connect.weight)
-            self.connects.append(new_connect)
-            new_connect = Connect((new_node.id, rand_connect.output_node), 1)
-            self.connects.append(new_connect)
-            rand_connect.enabled = False
+            # add new connections in place of the disabled connection
+            self.add_gene((input_node, new_node.id), weight)
+            self.add_gene((new_node.id, output_node), 1)
+            self.version += 1
 
     def remove_node(self):
         # check if hidden nodes exist
@@ -241,27 +299,28 @@ class Genome:
             index = randint(NUM_INPUTS + 1, self.first_output_index - 1)
             rand_node = self.nodes[index]
             # remove node connections
-            connects_to_remove = []
-            for connect in self.connects:
-                if connect.input_node == rand_node.id or connect.output_node == rand_node.id:
-                    connects_to_remove.append(connect)
-            for connect in connects_to_remove:
-                self.connects.remove(connect)
+            removed = (self.genes['input'] == rand_node.id) | (self.genes['output'] == rand_node.id)
+            for key in zip(self.genes['input'][removed].tolist(), self.genes['output'][removed].tolist()):
+                del self.connects_by_key[key]
+            self.genes = self.genes[~removed]
             # remove node
             self.node_layers[rand_node.layer] -= 1
-            self.nodes.remove(rand_node)
+            del self.nodes[index]
+            del self.nodes_by_id[rand_node.id]
             self.first_output_index -= 1
+            self.version += 1
 
     def modify_weight(self, replace_all=False):
         if replace_all:
             replace_chance = 1
         else:
             replace_chance = MUT_REPLACE_WEIGHT
-        for connect in self.connects:
-            if random() < replace_chance:
-                connect.weight = random() - 0.5
-            else:
-                connect.weight += uniform(-0.1, 0.1)
+        # replace a random selection of weights and perturb the rest
+        weights = self.genes['weight']
+        replace = np.random.random(len(weights)) < replace_chance
+        self.genes['weight'] = np.where(replace, np.random.random(len(weights)) - 0.5,
+                                        weights + np.random.uniform(-0.1, 0.1, len(weights)))
+        self.version += 1
 
     def mutate(self):
         mutation = False
@@ -285,16 +344,205 @@ class Genome:
             mutation = True
         return mutation
 
+class Network_plan:
+    # feed-forward evaluation of a genome compiled into one weight matrix per layer. each layer's nodes take the
+    # values of all nodes in lower layers as inputs, with zero weights where no enabled connection exists.
+    # outputs agree with the node by node path only to rounding (up to about 1e-15 with a few hundred connections):
+    # inputs are summed in node order rather than connection order, and the activation slope is folded into the
+    # weights. seeded runs therefore follow a different trajectory than before networks were compiled
+    def __init__(self, genome):
+        self.version = genome.version
+        self.first_output_index = genome.first_output_index
+        self.node_layers = tuple(genome.node_layers)
+        nodes = genome.nodes
+        node_index = {node.id: i for i, node in enumerate(nodes)}
+        # node values persist between evaluations, as with Node.value
+        self.values = np.array([node.value for node in nodes], dtype=float)
+        slopes = np.array([ACTIVATION_SLOPES[node.act_function_type] for node in nodes])
+        weights = np.zeros((len(nodes), len(nodes)))
+        has_input = np.zeros(len(nodes), dtype=bool)
+        genes = genome.genes[genome.genes['enabled']]
+        input_indexes = [node_index[node_id] for node_id in genes['input'].tolist()]
+        output_indexes = [node_index[node_id] for node_id in genes['output'].tolist()]
+        np.add.at(weights, (output_indexes, input_indexes), genes['weight'])
+        has_input[output_indexes] = True
+        # the negated activation slope is folded into the weights
+        self.weights = -slopes[:, None] * weights
+        self.has_input = has_input
+        self.layers = []
+        start = genome.node_layers[0]
+        for num_nodes in genome.node_layers[1:]:
+            end = start + num_nodes
+            # only nodes with enabled inputs are updated, as Node.update skips the rest
+            rows = start + np.flatnonzero(has_input[start:end])
+            if len(rows):
+                if len(rows) == rows[-1] - rows[0] + 1:
+                    rows = slice(rows[0], rows[-1] + 1)
+                self.layers.append((rows, start, self.weights[rows, :start]))
+            start = end
+
+    def evaluate(self, inputs):
+        values = self.values
+        values[1:NUM_INPUTS + 1] = inputs
+        for rows, start, weights in self.layers:
+            values[rows] = 1 / (1 + np.exp(weights @ values[:start]))
+        return values[self.first_output_index:self.first_output_index + NUM_OUTPUTS].copy()
+
+class Network_group:
+    # the stacked plans of a batch's networks that share node_layers. a network's row holds its plan's values, weights
+    # and has_input, and the plan's values become a view of the row, so node values persist whichever path evaluates
+    # them. rows past the group's networks are spare, so births rarely reallocate
+    def __init__(self, plan):
+        self.node_layers = plan.node_layers
+        self.first_output_index = plan.first_output_index
+        self.networks = []
+        self.plans = []
+        self.row_of = {}
+        self.allocate(GROUP_CAPACITY, len(plan.values))
+        # rows of the networks list the batch was given, set by the batch
+        self.indexes = None
+        self.layers = None
+
+    def allocate(self, capacity, num_nodes):
+        self.values = np.zeros((capacity, num_nodes))
+        self.weights = np.zeros((capacity, num_nodes, num_nodes))
+        self.has_input = np.zeros((capacity, num_nodes), dtype=bool)
+
+    def add(self, network, plan):
+        row = len(self.networks)
+        if row == len(self.values):
+            values, weights, has_input = self.values, self.weights, self.has_input
+            self.allocate(2 * row, values.shape[1])
+            self.values[:row] = values
+            self.weights[:row] = weights
+            self.has_input[:row] = has_input
+            for i, row_plan in enumerate(self.plans):
+                row_plan.values = self.values[i]
+        self.values[row] = plan.values
+        self.weights[row] = plan.weights
+        self.has_input[row] = plan.has_input
+        plan.values = self.values[row]
+        self.networks.append(network)
+        self.plans.append(plan)
+        self.row_of[network] = row
+        self.layers = None
+
+    def remove(self, network):
+        # the last row is moved into the freed one
+        row = self.row_of.pop(network)
+        self.plans[row].values = self.values[row].copy()
+        last = len(self.networks) - 1
+        if row != last:
+            self.values[row] = self.values[last]
+            self.weights[row] = self.weights[last]
+            self.has_input[row] = self.has_input[last]
+            self.networks[row] = self.networks[last]
+            self.plans[row] = self.plans[last]
+            self.plans[row].values = self.values[row]
+            self.row_of[self.networks[row]] = row
+        self.networks.pop()
+        self.plans.pop()
+        self.layers = None
+
+    def build_layers(self):
+        num_networks = len(self.networks)
+        self.layers = []
+        start = self.node_layers[0]
+        for num_nodes in self.node_layers[1:]:
+            end = start + num_nodes
+            layer_inputs = self.has_input[:num_networks, start:end]
+            if layer_inputs.any():
+                # mask is None when every node of every network in the group has inputs
+                mask = None if layer_inputs.all() else layer_inputs
+                self.layers.append((start, end, self.weights[:num_networks, start:end, :start], mask))
+            start = end
+
+    def evaluate(self, inputs, outputs):
+        if self.layers is None:
+            self.build_layers()
+        values = self.values[:len(self.networks)]
+        values[:, 1:NUM_INPUTS + 1] = inputs[self.indexes]
+        for start, end, weights, mask in self.layers:
+            layer_values = 1 / (1 + np.exp(np.matmul(weights, values[:, :start, None])[:, :, 0]))
+            if mask is None:
+                values[:, start:end] = layer_values
+            else:
+                values[:, start:end] = np.where(mask, layer_values, values[:, start:end])
+        outputs[self.indexes] = values[:, self.first_output_index:self.first_output_index + NUM_OUTPUTS]
+
+class Network_batch:
+    # evaluates a whole population of networks at once. networks with the same node_layers share a group whose
+    # weights are stacked, so each layer of a group is a single batched matmul. when the population changes only the
+    # rows of networks that were born, died or had their genome mutated since the last evaluation are written: a
+    # network is keyed by itself and the genome version its row was built from. outputs agree with Network_plan only
+    # to rounding, as the batched matmul may sum in a different order
+    def __init__(self):
+        # the networks and versions of the last evaluation. networks are kept, not just their ids, as a dead
+        # network's id can be given to a newborn one
+        self.networks = []
+        self.versions = []
+        # network -> (group, version of its row)
+        self.rows = {}
+        self.groups = {}
+
+    def build(self, networks):
+        # from scratch
+        self.rows = {}
+        self.groups = {}
+        self.update(networks)
+
+    def update(self, networks):
+        current = set(networks)
+        for network, (group, version) in list(self.rows.items()):
+            if network not in current or network.genome.version != version:
+                group.remove(network)
+                del self.rows[network]
+                if not group.networks:
+                    del self.groups[group.node_layers]
+        for network in networks:
+            if network not in self.rows:
+                plan = network.update_plan()
+                group = self.groups.get(plan.node_layers)
+                if group is None:
+                    group = self.groups[plan.node_layers] = Network_group(plan)
+                group.add(network, plan)
+                self.rows[network] = (group, plan.version)
+        index = {network: i for i, network in enumerate(networks)}
+        for group in self.groups.values():
+            group.indexes = np.array([index[network] for network in group.networks])
+        self.networks = list(networks)
+        self.versions = [network.genome.version for network in networks]
+
+    def evaluate(self, networks, inputs):
+        if not self.is_built(networks):
+            self.update(networks)
+        outputs = np.zeros((len(networks), NUM_OUTPUTS))
+        for group in self.groups.values():
+            group.evaluate(inputs, outputs)
+        return outputs
+
+    def is_built(self, networks):
+        if len(networks) != len(self.networks):
+            return False
+        for network, built_network, version in zip(networks, self.networks, self.versions):
+            if network is not built_network or network.genome.version != version:
+                return False
+        return True
+
 class Neural_network:
     def __init__(self, genome):
         self.genome = genome
         self.nodes = self.genome.nodes
         self.node_layers = self.genome.node_layers
-        self.create_network()
+        # the compiled plan and the node links are built when first needed
+        self.plan = None
+        self.linked = False
         self.outputs = np.zeros(NUM_OUTPUTS)
 
     def create_network(self):
         self.reset_network()
+        self.linked = True
+        nodes_by_id = self.genome.nodes_by_id
         if self.connects:
             # sort connections by output node IDs and set current node to top of the list
             self.connects.sort(key=lambda x: x.output_node)
@@ -304,25 +552,37 @@ class Neural_network:
             for connect in self.connects:
                 if connect.enabled == True:
                     # for each node, link input nodes and connection weights
-                    if connect.output_node is not current_node_id:
-                        current_node = find_by_id(current_node_id, self.nodes)
+                    if connect.output_node != current_node_id:
+                        current_node = nodes_by_id[current_node_id]
                         current_node.link(input_nodes, input_weights)
                         input_nodes = []
                         input_weights = []
                         current_node_id = connect.output_node
-                    input_nodes.append(find_by_id(connect.input_node, self.nodes))
+                    input_nodes.append(nodes_by_id[connect.input_node])
                     input_weights.append(connect.weight)
-            current_node = find_by_id(current_node_id, self.nodes)
+            current_node = nodes_by_id[current_node_id]
             current_node.link(input_nodes, input_weights)
 
     def reset_network(self):
-        self.connects = copy(self.genome.connects)
+        self.connects = self.genome.connects
         self.first_output_index = self.genome.first_output_index
         for node in self.nodes:
             node.input_nodes = []
             node.input_weights = []
 
+    def update_plan(self):
+        # recompile only if the genome has been mutated since the plan was built
+        if self.plan is None or self.plan.version != self.genome.version:
+            self.plan = Network_plan(self.genome)
+        return self.plan
+
     def get_outputs(self, inputs):
+        return self.update_plan().evaluate(inputs)
+
+    def get_node_outputs(self, inputs):
+        # reference path: update one node at a time through the linked Node objects
+        if not self.linked:
+            self.create_network()
         # load input values
         for i in range(NUM_INPUTS):
             self.nodes[i + 1].value = inputs[i]
@@ -334,59 +594,95 @@ class Neural_network:
             self.outputs[i] = self.nodes[self.first_output_index + i].value
         return self.outputs
 
+class Distance_cache:
+    # genomic distances and homologous gene counts of genome pairs, keyed by each genome's uid and version so
+    # mutated genomes miss. least recently used pairs are evicted once the cache is full, and all pairs of a genome
+    # are evicted when its organism dies
+    def __init__(self, max_size=DISTANCE_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        # keys of the pairs each genome uid is part of
+        self.genome_keys = defaultdict(set)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, genome1, genome2):
+        # distance is symmetric, so both orders share a key
+        key1 = (genome1.uid, genome1.version)
+        key2 = (genome2.uid, genome2.version)
+        if key1 < key2:
+            return (key1, key2)
+        return (key2, key1)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def add(self, key, entry):
+        self.entries[key] = entry
+        self.genome_keys[key[0][0]].add(key)
+        self.genome_keys[key[1][0]].add(key)
+        if len(self.entries) > self.max_size:
+            old_key, _ = self.entries.popitem(last=False)
+            self.discard_key(old_key)
+
+    def discard_key(self, key):
+        for uid in (key[0][0], key[1][0]):
+            keys = self.genome_keys.get(uid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.genome_keys[uid]
+
+    def evict(self, genome):
+        for key in self.genome_keys.pop(genome.uid, ()):
+            del self.entries[key]
+            self.discard_key(key)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups:
+            return self.hits / lookups
+        return 0
+
+    def clear(self):
+        self.entries.clear()
+        self.genome_keys.clear()
+        self.hits = 0
+        self.misses = 0
+
 class Neat:
     def __init__(self):
         self.species = []
         self.init_genome = Genome() # create initial genome from config
+        self.distance_cache = Distance_cache()
 
     def create_genome(self):
-        genome = deepcopy(self.init_genome)
+        genome = self.init_genome.clone()
         genome.modify_weight(replace_all=True)
         return genome
 
     def genomic_distance(self, genome1, genome2):
-        connects1 = genome1.connects
-        connects2 = genome2.connects
-        connects1_index = 0
-        connects2_index = 0
-        sum_weight_diff = 0
-        avg_weight_diff = 0
-        self.num_homologous = 0
-        num_disjoint = 0
-        num_genes = max([len(connects1), len(connects2)])
-        # in case no connections in either genome
-        if num_genes == 0:
-            return 0
-        # count homologous, disjoint and excess genes
-        while connects1_index < len(connects1) and connects2_index < len(connects2):
-            if connects1[connects1_index].id < connects2[connects2_index].id:
-                num_disjoint += 1
-                connects1_index += 1
-            elif connects1[connects1_index].id > connects2[connects2_index].id:
-                num_disjoint += 1
-                connects2_index += 1
-            else:
-                sum_weight_diff += abs(connects1[connects1_index].weight - connects2[connects2_index].weight)
-                self.num_homologous += 1
-                connects1_index += 1
-                connects2_index += 1
-        if connects1_index == len(connects1):
-            num_excess = len(connects2[connects2_index:])
-        else:
-            num_excess = len(connects1[connects1_index:])
-        # calculate genomic distance
-        if self.num_homologous:
-            avg_weight_diff = sum_weight_diff / self.num_homologous
-        genomic_distance = (C1 * num_excess + C2 * num_disjoint) + C3 * avg_weight_diff
-        return genomic_distance
+        return self.compare_genomes(genome1, genome2)[0]
+
+    def compare_genomes(self, genome1, genome2):
+        # genomic distance and number of homologous genes. genomes don't change once their organism is born, so
+        # pairs are recalculated only after a mutation
+        key = self.distance_cache.key(genome1, genome2)
+        comparison = self.distance_cache.get(key)
+        if comparison is None:
+            comparison = calc_genome_comparison(genome1, genome2)
+            self.distance_cache.add(key, comparison)
+        return comparison
 
     def crossover(self, parent1, parent2):
-        if self.genomic_distance(parent1.genome, parent2.genome) < COMPAT_THRESHOLD:
-            connects1_index = 0
-            connects2_index = 0
-            homologous_index = 0
-            weak_index = 0
-
+        distance, num_homologous = self.compare_genomes(parent1.genome, parent2.genome)
+        if distance < COMPAT_THRESHOLD:
             # determine dominant parent
             if parent1.adj_fitness > parent2.adj_fitness:
                 strong_parent = parent1
@@ -401,28 +697,19 @@ class Neat:
                 else:
                     strong_parent = parent2
                     weak_parent = parent1
-            connects1 = strong_parent.genome.connects
-            connects2 = weak_parent.genome.connects
+            weak_genes = weak_parent.genome.genes
             # crossover parents genomes
-            child_genome = deepcopy(strong_parent.genome)
-            num_weak_genes = int(self.num_homologous * WEAK_RATIO)
-            weak_index_list = np.random.choice(np.arange(self.num_homologous), num_weak_genes, replace=False)
-            weak_index_list.sort()
-            while weak_index < len(weak_index_list):
-                # skip disjoint genes
-                if connects1[connects1_index].id < connects2[connects2_index].id:
-                    connects1_index += 1
-                elif connects1[connects1_index].id > connects2[connects2_index].id:
-                    connects2_index += 1
-                else:
-                    # crossover weights and enabled status of strong and weak homologous genes
-                    if weak_index_list[weak_index] == homologous_index:
-                        child_genome.connects[connects1_index].weight = connects2[connects2_index].weight
-                        child_genome.connects[connects1_index].enabled = connects2[connects2_index].enabled
-                        weak_index += 1
-                    homologous_index += 1
-                    connects1_index += 1
-                    connects2_index += 1
+            child_genome = strong_parent.genome.clone()
+            num_weak_genes = int(num_homologous * WEAK_RATIO)
+            weak_index_list = np.random.choice(np.arange(num_homologous), num_weak_genes, replace=False)
+            if num_weak_genes:
+                # crossover weights and enabled status of the selected strong and weak homologous genes
+                homologous, weak_index = homologous_genes(child_genome.genes, weak_genes)
+                strong_index = np.flatnonzero(homologous)[weak_index_list]
+                weak_index = weak_index[strong_index]
+                child_genome.genes['weight'][strong_index] = weak_genes['weight'][weak_index]
+                child_genome.genes['enabled'][strong_index] = weak_genes['enabled'][weak_index]
+            child_genome.version += 1
             child_genome.mutate()
             return child_genome
         return False
@@ -432,7 +719,7 @@ class Neat:
         for species in self.species:
             if self.genomic_distance(child.genome, species.genome) < COMPAT_THRESHOLD:
                 child.species = species
-                species.population.append(child)
+                species.add(child)
                 species_exists = True
                 break
         # if child is not compatible with existing species, create new species
@@ -440,22 +727,66 @@ class Neat:
             new_species = Species(child.genome)
             self.species.append(new_species)
             child.species = new_species
-            new_species.population.append(child)
-
-    def calculate_fitness(self, organism):
-        organism.fitness_function()
-        adjustment = 0
-        for member in organism.species.population:
-            genomic_similarity = 1 - self.genomic_distance(organism.genome, member.genome) / COMPAT_THRESHOLD
-            if genomic_similarity > 0:
-                adjustment += genomic_similarity
-        organism.adj_fitness = organism.fitness / adjustment
+            new_species.add(child)
+
+    def share_fitness(self, organisms):
+        # adjusted fitness of every organism, from one distance matrix per species rather than a distance per pair
+        members = defaultdict(list)
+        for organism in organisms:
+            organism.fitness_function()
+            members[organism.species].append(organism)
+        for species, species_members in members.items():
+            distances = distance_matrix([organism.genome for organism in species_members])
+            genomic_similarity = np.maximum(1 - distances / COMPAT_THRESHOLD, 0)
+            # each organism's own similarity of 1 is included, as it is a member of its species
+            adjustments = genomic_similarity.sum(axis=1).tolist()
+            for organism, adjustment in zip(species_members, adjustments):
+                organism.adj_fitness = organism.fitness / adjustment
+            if SPECIES_REPRESENTATIVE == 'fittest':
+                species.genome = max(species_members, key=lambda organism: organism.adj_fitness).genome
+
+    def select_parents(self, organisms, num_pairs):
+        # pairs of distinct parents drawn in proportion to adjusted fitness. draws are binary searches of the
+        # cumulative fitness, so each pair costs O(log n) once the sums are built. with SPECIES_QUOTAS, pairs are
+        # shared between species by their total adjusted fitness and both parents come from the same species
+        organisms = list(organisms)
+        weights = np.array([organism.adj_fitness for organism in organisms], dtype=float)
+        if weights.sum() <= 0:
+            weights[:] = 1
+        if SPECIES_QUOTAS:
+            # organisms are grouped by species, so each species is a contiguous run of the cumulative fitness
+            species_ids = np.array([organism.species.id for organism in organisms])
+            order = np.argsort(species_ids, kind='stable')
+            organisms = [organisms[i] for i in order.tolist()]
+            weights = weights[order]
+            species_ids = species_ids[order]
+            starts = np.flatnonzero(np.r_[True, species_ids[1:] != species_ids[:-1]])
+            ends = np.r_[starts[1:], len(organisms)]
+        else:
+            starts = np.array([0])
+            ends = np.array([len(organisms)])
+        cumulative = np.cumsum(weights)
+        totals = cumulative[ends - 1] - np.r_[0, cumulative][starts]
+        # a species needs two members to breed
+        totals[ends - starts < 2] = 0
+        pairs = []
+        for start, end, quota in zip(starts.tolist(), ends.tolist(), offspring_quotas(totals, num_pairs).tolist()):
+            for _ in range(quota):
+                pair = sample_pair(cumulative, start, end)
+                if pair:
+                    pairs.append((organisms[pair[0]], organisms[pair[1]]))
+        return pairs
 
     def kill(self, organism):
-        for species in self.species:
-            if species.id == organism.species.id:
-                species.population.remove(organism)
-                break
+        self.distance_cache.evict(organism.genome)
+        species = organism.species
+        species.remove(organism)
+        if not species.population:
+            # extinct species are retired, so children are only compared against living species
+            self.species.remove(species)
+            self.distance_cache.evict(species.genome)
+        elif SPECIES_REPRESENTATIVE == 'oldest' and species.genome is organism.genome:
+            species.genome = species.oldest().genome
 
 class Species:
     id = 0
@@ -463,13 +794,115 @@ class Species:
         Species.id += 1
         self.id = Species.id
         self.genome = genome
-        self.population = []
+        # members in the order they joined, kept as dictionary keys so they are added and removed in constant time
+        self.population = {}
 
-    def sort_by_fitness(self):
-        self.population.sort(key=lambda x: x.adj_fitness, reverse=True)
+    def add(self, organism):
+        self.population[organism] = None
 
-def find_by_id(id, list):
-    for object in list:
-        if object.id == id:
-            return object
-    return False
+    def remove(self, organism):
+        del self.population[organism]
+
+    def oldest(self):
+        return next(iter(self.population))
+
+    def sort_by_fitness(self):
+        self.population = dict.fromkeys(sorted(self.population, key=lambda x: x.adj_fitness, reverse=True))
+
+def calc_genome_comparison(genome1, genome2):
+    # genomic distance and number of homologous genes of two genomes
+    genes1 = genome1.genes
+    genes2 = genome2.genes
+    avg_weight_diff = 0
+    # in case no connections in one or both genomes, all genes are excess
+    if len(genes1) == 0 or len(genes2) == 0:
+        return C1 * max(len(genes1), len(genes2)), 0
+    # count homologous, excess and disjoint genes. excess genes come after the other genome's last innovation
+    homologous, index2 = homologous_genes(genes1, genes2)
+    num_homologous = np.count_nonzero(homologous)
+    num_excess = (len(genes1) - index2.searchsorted(len(genes2)) +
+                  len(genes2) - genes2['id'].searchsorted(genes1['id'][-1], 'right'))
+    num_disjoint = len(genes1) + len(genes2) - 2 * num_homologous - num_excess
+    # calculate genomic distance
+    if num_homologous:
+        weight_diff = genes1['weight'][homologous] - genes2['weight'][index2[homologous]]
+        avg_weight_diff = np.abs(weight_diff).sum() / num_homologous
+    genomic_distance = (C1 * num_excess + C2 * num_disjoint) + C3 * avg_weight_diff
+    return float(genomic_distance), num_homologous
+
+def distance_matrix(genomes):
+    # genomic distance of every pair of genomes. genes are laid out in a genome by innovation matrix, where
+    # homologous gene counts are a matrix product and excess genes are read from cumulative gene counts
+    genes = np.concatenate([genome.genes for genome in genomes])
+    num_genes = np.array([len(genome.genes) for genome in genomes])
+    innovations, columns = np.unique(genes['id'], return_inverse=True)
+    rows = np.repeat(np.arange(len(genomes)), num_genes)
+    present = np.zeros((len(genomes), len(innovations)), dtype=bool)
+    present[rows, columns] = True
+    num_homologous = present.astype(float) @ present.T.astype(float)
+    # genes of each genome up to each innovation, with a leading column for genomes without genes
+    cumulative = np.zeros((len(genomes), len(innovations) + 1))
+    cumulative[:, 1:] = np.cumsum(present, axis=1)
+    ends = np.cumsum(num_genes)
+    last_columns = np.where(num_genes > 0, np.append(columns, 0)[ends - 1] + 1, 0)
+    # genes of genome i up to the last innovation of genome j
+    genes_before = cumulative[:, last_columns]
+    num_excess = (num_genes[:, None] - genes_before) + (num_genes[None, :] - genes_before.T)
+    num_disjoint = num_genes[:, None] + num_genes[None, :] - 2 * num_homologous - num_excess
+    # summed absolute weight differences of homologous genes, one innovation at a time so the work is the number
+    # of homologous pairs rather than pairs times innovations
+    sum_weight_diff = np.zeros((len(genomes), len(genomes)))
+    order = np.argsort(columns, kind='stable')
+    innovation_rows = rows[order]
+    innovation_weights = genes['weight'][order]
+    starts = np.searchsorted(columns[order], np.arange(len(innovations) + 1)).tolist()
+    for start, end in zip(starts, starts[1:]):
+        if end - start > 1:
+            weights = innovation_weights[start:end]
+            weight_diff = np.abs(weights[:, None] - weights[None, :])
+            if end - start == len(genomes):
+                sum_weight_diff += weight_diff
+            else:
+                genome_rows = innovation_rows[start:end]
+                sum_weight_diff[np.ix_(genome_rows, genome_rows)] += weight_diff
+    avg_weight_diff = sum_weight_diff / np.maximum(num_homologous, 1)
+    return (C1 * num_excess + C2 * num_disjoint) + C3 * avg_weight_diff
+
+def offspring_quotas(totals, num_offspring):
+    # num_offspring shared in proportion to totals, rounded by the largest remainder method
+    if totals.sum() <= 0:
+        return np.zeros(len(totals), dtype=int)
+    shares = totals * num_offspring / totals.sum()
+    quotas = np.floor(shares).astype(int)
+    remainder = num_offspring - quotas.sum()
+    if remainder:
+        quotas[np.argsort(quotas - shares, kind='stable')[:remainder]] += 1
+    return quotas
+
+def sample_pair(cumulative, start, end):
+    # two distinct indices in [start, end), each drawn in proportion to its weight, where cumulative is the running
+    # sum of the weights. the second draw leaves out the first index's interval. returns None if only one index
+    # has any weight
+    base = cumulative[start - 1] if start else 0
+    total = cumulative[end - 1] - base
+    first = min(int(cumulative.searchsorted(base + random() * total, 'right')), end - 1)
+    first_start = cumulative[first - 1] if first else 0
+    weight = cumulative[first] - first_start
+    if total - weight <= 0:
+        return None
+    value = base + random() * (total - weight)
+    if value >= first_start:
+        value += weight
+    second = min(int(cumulative.searchsorted(value, 'right')), end - 1)
+    if second == first:
+        return None
+    return first, second
+
+def homologous_genes(genes1, genes2):
+    # binary search of each innovation of genes1 in genes2, both sorted by innovation and genes2 not empty. returns
+    # whether each gene of genes1 has a homologous gene and the search index, which is that gene's index if it does
+    ids1 = genes1['id']
+    ids2 = genes2['id']
+    index2 = ids2.searchsorted(ids1)
+    homologous = ids2[np.minimum(index2, len(ids2) - 1)] == ids1
+    return homologous, index2
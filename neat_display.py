@@ -10,22 +10,39 @@ class Neat_display():
         self.scaler = self.height / 160
         self.node_size = int(5 * self.scaler)
         self.font = pygame.font.SysFont('arial', 15, bold=True)
+        # diagram of the last network drawn, redrawn when the genome, its version or the caption changes
+        self.surface = None
+        self.genome = None
+        self.version = None
+        self.caption = None
 
     def update(self, neural_network, caption=''):
+        genome = neural_network.genome
+        if self.surface is None or self.genome is not genome or self.version != genome.version or self.caption != caption:
+            self.surface = self.draw_network(neural_network, caption)
+            self.genome = genome
+            self.version = genome.version
+            self.caption = caption
+        self.display_surface.blit(self.surface, (self.x_offset, self.y_offset), special_flags=pygame.BLEND_PREMULTIPLIED)
+
+    def draw_network(self, neural_network, caption):
+        # the diagram is drawn to a premultiplied alpha surface so the translucent background blends as before
+        surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
         node_positions = {}
         node_index = 0
         self.node_layers = neural_network.node_layers
         self.nodes = neural_network.nodes
-        self.connects = neural_network.connects
+        self.connects = neural_network.genome.connects
 
         # background
-        draw_rect_alpha(self.display_surface, (255, 255, 255, 50), (self.x_offset, self.y_offset, self.width, self.height))
+        surface.fill((255, 255, 255, 50))
+        surface = surface.premul_alpha()
 
         # create dictionary of node positions
         for n in range(len(self.node_layers)):
-            x = (self.width // (len(self.node_layers) + 1)) * (n + 1) + self.x_offset
+            x = (self.width // (len(self.node_layers) + 1)) * (n + 1)
             for i in range(self.node_layers[n]):
-                y = (self.height // (self.node_layers[n] + 1)) * (i + 1) + self.y_offset
+                y = (self.height // (self.node_layers[n] + 1)) * (i + 1)
                 node_positions[self.nodes[node_index].id] = (x, y)
                 node_index += 1
         # draw connections
@@ -38,16 +55,11 @@ class Neat_display():
                     colour = 'green'
                 else:
                     colour = 'red'
-                pygame.draw.line(self.display_surface, colour, start, end, width)
+                pygame.draw.line(surface, colour, start, end, width)
         # draw nodes
         for node in self.nodes:
-            pygame.draw.circle(self.display_surface, 'blue', node_positions[node.id], self.node_size)
+            pygame.draw.circle(surface, 'blue', node_positions[node.id], self.node_size)
         # draw caption
-        text = self.font.render(str(caption), True, 'black')
-        self.display_surface.blit(text, (self.x_offset + 5, self.y_offset + 5))
-
-def draw_rect_alpha(surface, color, rect):
-    shape_surf = pygame.Surface(pygame.Rect(rect).size, pygame.SRCALPHA)
-    pygame.draw.rect(shape_surf, color, shape_surf.get_rect())
-    surface.blit(shape_surf, rect)
-
+        text = self.font.render(str(caption), True, 'black').convert_alpha().premul_alpha()
+        surface.blit(text, (5, 5), special_flags=pygame.BLEND_PREMULTIPLIED)
+        return surface
@@ -1,19 +1,21 @@
 import numpy as np
 import pygame, math, neat
 from random import uniform
-from support import calc_diff, calc_mag, calc_angle, import_folder
+from support import calc_angle
+from assets import asset_store, sprite_cache
 from settings import *
+from config import NUM_OUTPUTS
 
 class Organism(pygame.sprite.Sprite):
-    def __init__(self, genome, groups, pos, food_group):
+    def __init__(self, genome, groups, pos, headless=False):
         super().__init__(groups)
+        self.headless = headless
         # setup neural network
         self.genome = genome
         self.nnet = neat.Neural_network(genome)
-        self.food_group = food_group
+        self.nnet_outputs = np.zeros(NUM_OUTPUTS)
         self.fitness = 0
         self.adj_fitness = 0
-        self.adj_fitness_norm = 0
 
         # genome attributes
         self.size = genome.size
@@ -21,16 +23,19 @@ class Organism(pygame.sprite.Sprite):
         self.agility = genome.agility
 
         # animation setup
-        self.import_images()
         self.status = 'idle'
         self.frame_index = 0
 
         # sprite setup
-        self.image = self.animations[self.status][self.frame_index]
-        self.image = pygame.transform.rotozoom(self.image, -90, self.size)
-        self.original_image = self.image
-        self.rect = self.image.get_rect(center=pos)
-        self.mask = pygame.mask.from_surface(self.image)
+        self.radius = ORGANISM_RADIUS * self.size
+        if self.headless:
+            self.rect = pygame.Rect(0, 0, 2 * self.radius, 2 * self.radius)
+            self.rect.center = pos
+        else:
+            self.import_images()
+            self.image, self.mask = sprite_cache.get(self.status, self.frame_index,
+                                                     self.animations[self.status][self.frame_index], self.size, 0)
+            self.rect = self.image.get_rect(center=pos)
 
         # movement attributes
         self.pos = pygame.math.Vector2(self.rect.center)
@@ -38,6 +43,7 @@ class Organism(pygame.sprite.Sprite):
         self.direction = pygame.math.Vector2(uniform(-1, 1), uniform(-1, 1))
         pygame.math.Vector2.normalize_ip(self.direction)
         self.rotation = 0
+        self.target = (R_NORM + 1, 0)
         self.vel = 0
         self.accel = 0
         self.mass = math.exp(self.size)
@@ -57,12 +63,11 @@ class Organism(pygame.sprite.Sprite):
         self.fitness = math.sqrt(self.food_count) + r0
 
     def import_images(self):
-        self.animations = {'idle': [], 'move': []}
-        for animation in self.animations.keys():
-            full_path = 'graphics/organism/' + animation
-            self.animations[animation] = import_folder(full_path)
+        self.animations = asset_store.import_animations('graphics/organism', ['idle', 'move'])
 
     def animate(self, dt):
+        if self.headless:
+            return
         if self.status == 'idle':
             self.frame_index += 4 * dt
         elif self.status == 'move':
@@ -70,8 +75,6 @@ class Organism(pygame.sprite.Sprite):
 
         if self.frame_index >= len(self.animations[self.status]):
             self.frame_index = 0
-        self.original_image = self.animations[self.status][int(self.frame_index)]
-        self.original_image = pygame.transform.rotozoom(self.original_image, -90, self.size)
 
     def action(self, nnet_outputs):
         if nnet_outputs[0] > 0.5 and nnet_outputs[1] < 0.5:
@@ -112,41 +115,23 @@ class Organism(pygame.sprite.Sprite):
         elif self.pos.y < 0:
             self.pos.y += MAP_HEIGHT
 
-        # update image
-        angle = calc_angle(self.direction)
-        self.image = pygame.transform.rotate(self.original_image, -angle)
-        self.rect = self.image.get_rect(center=self.pos)
+        self.update_image()
+
+    def update_image(self):
+        if not self.headless:
+            frame_index = int(self.frame_index)
+            self.image, self.mask = sprite_cache.get(self.status, frame_index, self.animations[self.status][frame_index],
+                                                     self.size, calc_angle(self.direction))
+            self.rect = self.image.get_rect(center=self.pos)
         self.rect.centerx = round(self.pos.x)
         self.rect.centery = round(self.pos.y)
-        self.mask = pygame.mask.from_surface(self.image)
-        self.collisions()
-
-    def collisions(self):
-        collisions = pygame.sprite.spritecollide(self, self.food_group, False, pygame.sprite.collide_mask)
-        if collisions:
-            for food in collisions:
-                if food.radius <= self.size * 8:
-                    if self.energy < 50 * self.size:
-                        self.energy += food.energy
-                        self.food_count += 1
-                        food.kill()
-
-    def seek(self, food_group):
-        r0 = R_NORM + 1
-        d0 = pygame.math.Vector2()
-        for food in food_group:
-            if food.radius <= self.size * 8:
-                d = calc_diff(self.pos, food.pos)
-                r = calc_mag(d)
-                if r < r0:
-                    d0 = d
-                    r0 = r
-        phi = pygame.math.Vector2(self.direction).angle_to((d0.x, d0.y))
-        if phi > 180:
-            phi -= 360
-        elif phi < -180:
-            phi += 360
-        return r0, phi
+
+    def eat(self, food):
+        if food.radius <= self.size * 8:
+            if self.energy < 50 * self.size:
+                self.energy += food.energy
+                self.food_count += 1
+                food.kill()
 
     def update_energy(self):
         if self.energy < self.energy_loss:
@@ -159,9 +144,8 @@ class Organism(pygame.sprite.Sprite):
     def update(self, dt):
         self.energy_loss += (1 + self.force / 1000) * dt
         self.age += dt
-        self.target = self.seek(self.food_group)
-        nnet_inputs = np.array([self.target[0], self.target[1]])
-        nnet_outputs = self.nnet.get_outputs(nnet_inputs)
-        self.action(nnet_outputs)
+        # self.target and self.nnet_outputs are set for the whole population by Environment.seek_food and
+        # Environment.think
+        self.action(self.nnet_outputs)
         self.animate(dt)
         self.move(dt)
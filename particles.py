@@ -1,56 +1,263 @@
+import numpy as np
 import pygame
 import pygame.gfxdraw
-from support import calc_mag, calc_diff
+from support import gather_ranges, wrap_diffs
 from settings import *
 
+class Particle_system:
+    # positions and velocities of a set of particles stored as arrays, so whole systems can be moved in batch
+    def __init__(self, capacity=64):
+        self.pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.radius = np.zeros(capacity)
+        self.sprites = []
+        self.count = 0
+        # incremented whenever positions change so sprites know when to refresh their rects
+        self.version = 0
+
+    def add(self, particle, pos, radius=0):
+        if self.count == len(self.pos):
+            self.grow()
+        particle.index = self.count
+        self.pos[self.count] = pos
+        self.vel[self.count] = 0
+        self.radius[self.count] = radius
+        self.sprites.append(particle)
+        self.count += 1
+        self.version += 1
+
+    def remove(self, particle):
+        # move the last particle into the freed slot
+        index = particle.index
+        last = self.count - 1
+        if index != last:
+            last_particle = self.sprites[last]
+            self.pos[index] = self.pos[last]
+            self.vel[index] = self.vel[last]
+            self.radius[index] = self.radius[last]
+            self.sprites[index] = last_particle
+            last_particle.index = index
+        self.sprites.pop()
+        self.count -= 1
+        particle.index = None
+        self.version += 1
+
+    def grow(self):
+        capacity = len(self.pos) * 2
+        self.pos = np.resize(self.pos, (capacity, 2))
+        self.vel = np.resize(self.vel, (capacity, 2))
+        self.radius = np.resize(self.radius, capacity)
+
+    def positions(self):
+        return self.pos[:self.count]
+
+    def velocities(self):
+        return self.vel[:self.count]
+
 class Particle(pygame.sprite.Sprite):
-    def __init__(self, groups, pos):
+    def __init__(self, groups, pos, system, headless=False):
+        # the system is set before joining groups, which sort sprites by it
+        self.system = system
+        self.index = None
         super().__init__(groups)
         self.groups = groups
+        self.headless = headless
 
         # # sprite setup
-        self.image = pygame.Surface([2, 2])
-        self.image.fill('red')
-        self.rect = self.image.get_rect(center=pos)
+        if self.headless:
+            self.rect = pygame.Rect(0, 0, 2, 2)
+            self.rect.center = pos
+        else:
+            self.image = pygame.Surface([2, 2])
+            self.image.fill('red')
+            self.rect = self.image.get_rect(center=pos)
+
+        # movement attributes are stored in the particle system
+        self.system.add(self, self._rect.center)
+
+    @property
+    def pos(self):
+        return pygame.math.Vector2(self.system.pos[self.index].tolist())
+
+    @pos.setter
+    def pos(self, pos):
+        self.system.pos[self.index] = pos
+        self.system.version += 1
+
+    @property
+    def vel(self):
+        return pygame.math.Vector2(self.system.vel[self.index].tolist())
+
+    @vel.setter
+    def vel(self, vel):
+        self.system.vel[self.index] = vel
 
-        # movement attributes
-        self.pos = pygame.math.Vector2(self.rect.center)
-        self.vel = pygame.math.Vector2()
+    @property
+    def rect(self):
+        # positions are only read back from the system when the rect is needed
+        if self.rect_version != self.system.version and self.index is not None:
+            x, y = self.system.pos[self.index].tolist()
+            self._rect.centerx = round(x)
+            self._rect.centery = round(y)
+            self.rect_version = self.system.version
+        return self._rect
+
+    @rect.setter
+    def rect(self, rect):
+        self._rect = rect
+        self.rect_version = None
+
+    def kill(self):
+        if self.index is not None:
+            self.system.remove(self)
+        super().kill()
 
 class Food(Particle):
-    def __init__(self, groups, pos, radius):
-        Particle.__init__(self, groups, pos)
+    def __init__(self, groups, pos, radius, system, headless=False):
+        Particle.__init__(self, groups, pos, system, headless)
         self.radius = radius
         self.energy = radius**2 * 2
+        self.system.radius[self.index] = radius
 
         # sprite setup
         diameter = radius * 2
-        food_surf = pygame.Surface((diameter + 1, diameter + 1), pygame.SRCALPHA)
-        pygame.draw.circle(food_surf, (0, 255, 50), (radius, radius), radius)
-        pygame.gfxdraw.aacircle(food_surf, radius, radius, radius, (0, 255, 50))
-        self.image = food_surf
-        self.rect = self.image.get_rect(center=pos)
-        self.mask = pygame.mask.from_surface(self.image)
-
-def move_particles(group1, group2, g, dt):
-    if group1 and group2:
-        for particle1 in group1:
-            force = pygame.math.Vector2()
-            for particle2 in group2:
-                d = calc_diff(particle1.pos, particle2.pos)
-                r = calc_mag(d)
-                if r and r < MAP_WIDTH:
-                    direction = pygame.math.Vector2.normalize(d)
-                    force += (g * 1 / (r + 100)) * direction
-            particle1.vel = (particle1.vel + force * dt * 5) * 0.2
-            particle1.pos += particle1.vel * dt * 5
-            if particle1.pos.x > MAP_WIDTH:
-                particle1.pos.x -= MAP_WIDTH
-            elif particle1.pos.x < 0:
-                particle1.pos.x += MAP_WIDTH
-            if particle1.pos.y > MAP_HEIGHT:
-                particle1.pos.y -= MAP_HEIGHT
-            elif particle1.pos.y < 0:
-                particle1.pos.y += MAP_HEIGHT
-            particle1.rect.centerx = round(particle1.pos.x)
-            particle1.rect.centery = round(particle1.pos.y)
+        if self.headless:
+            self.rect = pygame.Rect(0, 0, diameter + 1, diameter + 1)
+            self.rect.center = pos
+        else:
+            food_surf = pygame.Surface((diameter + 1, diameter + 1), pygame.SRCALPHA)
+            pygame.draw.circle(food_surf, (0, 255, 50), (radius, radius), radius)
+            pygame.gfxdraw.aacircle(food_surf, radius, radius, radius, (0, 255, 50))
+            self.image = food_surf
+            self.rect = self.image.get_rect(center=pos)
+            self.mask = pygame.mask.from_surface(self.image)
+
+def move_particle_systems(system1, system2, g, dt):
+    # batched equivalent of the reference kernel in benchmark.py: forces on system1 from system2 are summed from positions at the start
+    # of the step, then every particle in system1 is moved and wrapped at once
+    if system1.count and system2.count:
+        pos = system1.positions()
+        vel = system1.velocities()
+        if PARTICLE_SOLVER == 'grid':
+            force = calc_forces_grid(pos, system2.positions(), g)
+        else:
+            force = calc_forces(pos, system2.positions(), g)
+        vel += force * dt * 5
+        vel *= 0.2
+        pos += vel * dt * 5
+        wrap_positions(pos)
+        system1.version += 1
+
+def calc_forces(pos1, pos2, g):
+    force = np.zeros_like(pos1)
+    # process rows in chunks to bound the size of the pairwise arrays
+    chunk_size = max(1, PARTICLE_CHUNK_SIZE // len(pos2))
+    for start in range(0, len(pos1), chunk_size):
+        end = start + chunk_size
+        dx = pos2[:, 0] - pos1[start:end, 0, None]
+        dy = pos2[:, 1] - pos1[start:end, 1, None]
+        force[start:end, 0], force[start:end, 1] = sum_forces(dx, dy, g)
+    return force
+
+def calc_forces_grid(pos1, pos2, g, cell_size=PARTICLE_GRID_CELL, near_cells=PARTICLE_NEAR_CELLS):
+    # approximate solver: sources in cells within near_cells of a target's cell are summed exactly, all other
+    # cells act as a single particle of their combined mass at their centre of mass
+    # the map wraps, so a partial cell at the seam would be treated as a full one by the near block and the half-map
+    # cut. cells have to tile the map exactly
+    if MAP_WIDTH % cell_size or MAP_HEIGHT % cell_size:
+        raise ValueError('grid solver cell size ' + str(cell_size) + ' does not divide the map size (' +
+                         str(MAP_WIDTH) + ' x ' + str(MAP_HEIGHT) + ')')
+    force = np.zeros_like(pos1)
+    num_cells_x = MAP_WIDTH // cell_size
+    num_cells_y = MAP_HEIGHT // cell_size
+    cells1 = calc_cells(pos1, cell_size, num_cells_x, num_cells_y)
+    cells2 = calc_cells(pos2, cell_size, num_cells_x, num_cells_y)
+    num_cells = num_cells_x * num_cells_y
+    # sources sorted by cell, and the mass and centre of mass of every occupied cell
+    order2 = np.argsort(cells2, kind='stable')
+    counts = np.bincount(cells2, minlength=num_cells)
+    starts = np.concatenate(([0], np.cumsum(counts)))
+    occupied = np.flatnonzero(counts)
+    mass = counts[occupied]
+    com_x = np.bincount(cells2, weights=pos2[:, 0], minlength=num_cells)[occupied] / mass
+    com_y = np.bincount(cells2, weights=pos2[:, 1], minlength=num_cells)[occupied] / mass
+    # targets sorted by cell
+    order1 = np.argsort(cells1, kind='stable')
+    target_cells, target_starts, target_counts = np.unique(cells1[order1], return_index=True, return_counts=True)
+    # cell offsets summed exactly: the block around a target's cell, and cells that may straddle the half-map cut of
+    # the minimum-image convention, as the force is long-ranged and its direction flips across the cut
+    block_x = np.zeros(num_cells_x, dtype=bool)
+    block_y = np.zeros(num_cells_y, dtype=bool)
+    block_x[np.arange(-near_cells, near_cells + 1) % num_cells_x] = True
+    block_y[np.arange(-near_cells, near_cells + 1) % num_cells_y] = True
+    cut_x = np.zeros(num_cells_x, dtype=bool)
+    cut_y = np.zeros(num_cells_y, dtype=bool)
+    cut_x[cut_offsets(num_cells_x, cell_size, MAP_WIDTH)] = True
+    cut_y[cut_offsets(num_cells_y, cell_size, MAP_HEIGHT)] = True
+    # near cells of every occupied target cell (rows) among the occupied source cells (columns)
+    target_x, target_y = np.divmod(target_cells, num_cells_y)
+    source_x, source_y = np.divmod(occupied, num_cells_y)
+    offset_x = (source_x - target_x[:, None]) % num_cells_x
+    offset_y = (source_y - target_y[:, None]) % num_cells_y
+    is_near = block_x[offset_x] & block_y[offset_y] | cut_x[offset_x] | cut_y[offset_y]
+
+    # positions of the sources in each target cell's near cells, one run per target cell
+    pair_rows, pair_columns = np.nonzero(is_near)
+    pair_starts = starts[occupied[pair_columns]]
+    near_sources = order2[gather_ranges(pair_starts, pair_starts + mass[pair_columns])]
+    near_counts = np.bincount(pair_rows, weights=mass[pair_columns], minlength=len(target_cells)).astype(int)
+    near_starts = np.cumsum(near_counts) - near_counts
+    max_near = near_counts.max()
+    # padded at the end, so a padded run can read past the last cell's sources
+    near_x = np.concatenate((pos2[near_sources, 0], np.zeros(max_near)))
+    near_y = np.concatenate((pos2[near_sources, 1], np.zeros(max_near)))
+    # targets are taken in chunks in order of their number of near sources, each padded to the most near sources in
+    # its chunk. padding has no mass
+    far_mass = g * mass * ~is_near
+    target_rows = np.repeat(np.arange(len(target_cells)), target_counts)
+    by_near_count = np.argsort(near_counts[target_rows], kind='stable')
+    order1 = order1[by_near_count]
+    target_rows = target_rows[by_near_count]
+    chunk_size = max(1, PARTICLE_GRID_CHUNK // (max_near + len(occupied)))
+    for start in range(0, len(order1), chunk_size):
+        end = start + chunk_size
+        targets = order1[start:end]
+        rows = target_rows[start:end]
+        columns = np.arange(near_counts[rows[-1]])
+        x = pos1[targets, 0, None]
+        y = pos1[targets, 1, None]
+        # near field: exact sum over the sources in the surrounding cells (wrapping around the map)
+        index = near_starts[rows, None] + columns
+        is_source = columns < near_counts[rows, None]
+        fx, fy = sum_forces(near_x[index] - x, near_y[index] - y, g * is_source)
+        # far field: one interaction per occupied cell outside the near cells
+        far_fx, far_fy = sum_forces(com_x - x, com_y - y, far_mass[rows])
+        force[targets, 0] = fx + far_fx
+        force[targets, 1] = fy + far_fy
+    return force
+
+def cut_offsets(num_cells, cell_size, map_size):
+    # cell offsets whose separation range contains half the map size
+    offsets = np.arange(num_cells)
+    return offsets[np.abs(offsets * cell_size - map_size / 2) < cell_size]
+
+def calc_cells(pos, cell_size, num_cells_x, num_cells_y):
+    cell_x = np.clip((pos[:, 0] // cell_size).astype(int), 0, num_cells_x - 1)
+    cell_y = np.clip((pos[:, 1] // cell_size).astype(int), 0, num_cells_y - 1)
+    return cell_x * num_cells_y + cell_y
+
+def sum_forces(dx, dy, g):
+    wrap_diffs(dx, dy)
+    r = np.sqrt(dx * dx + dy * dy)
+    # coincident particles exert no force (minimum-image distances never reach MAP_WIDTH)
+    r[r == 0] = np.inf
+    scale = g / ((r + 100) * r)
+    return (scale * dx).sum(axis=1), (scale * dy).sum(axis=1)
+
+def wrap_positions(pos):
+    x = pos[:, 0]
+    y = pos[:, 1]
+    x[x > MAP_WIDTH] -= MAP_WIDTH
+    x[x < 0] += MAP_WIDTH
+    y[y > MAP_HEIGHT] -= MAP_HEIGHT
+    y[y < 0] += MAP_HEIGHT
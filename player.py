@@ -1,5 +1,6 @@
 import pygame, math
-from support import calc_angle, import_folder
+from support import calc_angle
+from assets import asset_store, sprite_cache
 from settings import *
 
 class Player(pygame.sprite.Sprite):
@@ -18,11 +19,9 @@ class Player(pygame.sprite.Sprite):
         self.frame_index = 0
 
         # sprite setup
-        self.image = self.animations[self.status][self.frame_index]
-        self.image = pygame.transform.rotozoom(self.image, -90, self.size)
-        self.original_image = self.image
+        self.image, self.mask = sprite_cache.get(self.status, self.frame_index,
+                                                 self.animations[self.status][self.frame_index], self.size, 0)
         self.rect = self.image.get_rect(center=pos)
-        self.mask = pygame.mask.from_surface(self.image)
 
         # movement attributes
         self.pos = pygame.math.Vector2(self.rect.center)
@@ -33,11 +32,7 @@ class Player(pygame.sprite.Sprite):
         self.mass = math.exp(self.size)
 
     def import_images(self):
-        self.animations = {'idle': [], 'move': []}
-
-        for animation in self.animations.keys():
-            full_path = 'graphics/organism/' + animation
-            self.animations[animation] = import_folder(full_path)
+        self.animations = asset_store.import_animations('graphics/organism', ['idle', 'move'])
 
     def animate(self, dt):
         if self.status == 'idle':
@@ -47,8 +42,6 @@ class Player(pygame.sprite.Sprite):
 
         if self.frame_index >= len(self.animations[self.status]):
             self.frame_index = 0
-        self.original_image = self.animations[self.status][int(self.frame_index)]
-        self.original_image = pygame.transform.rotozoom(self.original_image, -90, self.size)
 
     def user_input(self):
         keys = pygame.key.get_pressed()
@@ -87,12 +80,12 @@ class Player(pygame.sprite.Sprite):
         elif self.pos.y < 0:
             self.pos.y += MAP_HEIGHT
 
-        angle = calc_angle(self.direction)
-        self.image = pygame.transform.rotate(self.original_image, -angle)
+        frame_index = int(self.frame_index)
+        self.image, self.mask = sprite_cache.get(self.status, frame_index, self.animations[self.status][frame_index],
+                                                 self.size, calc_angle(self.direction))
         self.rect = self.image.get_rect(center=self.pos)
         self.rect.centerx = round(self.pos.x)
         self.rect.centery = round(self.pos.y)
-        self.mask = pygame.mask.from_surface(self.image)
         # self.collisions()
 
     def collisions(self):
@@ -0,0 +1,68 @@
+import time, csv
+import numpy as np
+from settings import *
+
+class Profiler:
+    # time spent in each phase of a tick, kept for the last num_samples ticks. a tick is one environment update
+    # plus any drawing since the previous update. marks return straight away while disabled
+    def __init__(self, phases, num_samples=PROFILER_SAMPLES, enabled=PROFILER_ENABLED):
+        self.phases = phases
+        self.phase_index = {phase: i for i, phase in enumerate(phases)}
+        self.samples = np.zeros((num_samples, len(phases)))
+        self.current = np.zeros(len(phases))
+        self.num_ticks = 0
+        self.enabled = enabled
+        self.last_time = time.perf_counter()
+        self.stats_tick = None
+        self.stats = {}
+        self.csv_file = None
+        self.csv_writer = None
+
+    def begin(self):
+        if self.enabled:
+            self.last_time = time.perf_counter()
+
+    def mark(self, phase):
+        # time since the last mark (or begin) is added to phase
+        if self.enabled:
+            current_time = time.perf_counter()
+            self.current[self.phase_index[phase]] += current_time - self.last_time
+            self.last_time = current_time
+
+    def end(self):
+        if self.enabled:
+            self.samples[self.num_ticks % len(self.samples)] = self.current
+            if self.csv_writer:
+                self.csv_writer.writerow([self.num_ticks] + [round(seconds * 1000, 4) for seconds in self.current])
+            self.current[:] = 0
+            self.num_ticks += 1
+
+    def calc_stats(self, refresh=PROFILER_REFRESH):
+        # p50, p95 and max of each phase in milliseconds, recalculated every refresh ticks
+        if self.num_ticks and (self.stats_tick is None or self.num_ticks - self.stats_tick >= refresh):
+            self.stats_tick = self.num_ticks
+            samples = self.samples[:min(self.num_ticks, len(self.samples))] * 1000
+            p50, p95 = np.percentile(samples, (50, 95), axis=0)
+            maximum = samples.max(axis=0)
+            self.stats = {phase: (p50[i], p95[i], maximum[i]) for i, phase in enumerate(self.phases)}
+        return self.stats
+
+    def reset(self):
+        self.samples[:] = 0
+        self.current[:] = 0
+        self.num_ticks = 0
+        self.stats_tick = None
+        self.stats = {}
+
+    def start_csv(self, file_name):
+        # stream every tick's phase times (ms) to a csv file
+        self.stop_csv()
+        self.csv_file = open(file_name, 'w', newline='')
+        self.csv_writer = csv.writer(self.csv_file)
+        self.csv_writer.writerow(['tick'] + self.phases)
+
+    def stop_csv(self):
+        if self.csv_file:
+            self.csv_file.close()
+        self.csv_file = None
+        self.csv_writer = None
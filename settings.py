@@ -6,9 +6,48 @@ SCREEN_HEIGHT = 640
 MAP_WIDTH = SCREEN_WIDTH * 4
 MAP_HEIGHT = SCREEN_HEIGHT * 4
 FPS = 30
+SIM_DT = 1 / FPS # fixed simulation step
+HEADLESS_DT = SIM_DT
+MAX_SUBSTEPS = 5 # most steps run to catch up before a frame is drawn, the rest of the backlog is dropped
+TURBO_FRAME_BUDGET = 1 / FPS # wall time spent stepping between event checks in turbo mode
+TURBO_RENDER_INTERVAL = 0.5 # wall time between drawn frames in turbo mode
 DRAG_COEFFICIENT = 1
 R_NORM = sqrt(MAP_WIDTH * MAP_WIDTH + MAP_HEIGHT * MAP_HEIGHT) / 2
 
+# particle engine
+PARTICLE_CHUNK_SIZE = 1000000 # max pairwise interactions held in memory at once
+# 'exact' or 'grid' (approximate). the grid solver is only faster from roughly 500 particles per system (about 2x at
+# 1000, 9x at 10000), so the exact solver suits the game's food and dark matter
+PARTICLE_SOLVER = 'exact'
+PARTICLE_GRID_CELL = 128 # grid solver cell size, smaller is more accurate. must divide MAP_WIDTH and MAP_HEIGHT
+PARTICLE_GRID_CHUNK = 32768 # target-source pairs the grid solver works on at once, kept small to stay in cache
+PARTICLE_NEAR_CELLS = 1 # cells either side of a particle's cell that the grid solver sums exactly
+
+# sprite cache
+SPRITE_CACHE_SIZE = 4096 # max rotated and scaled frames kept
+SPRITE_ANGLE_STEP = 5 # degrees between cached rotations
+SPRITE_SIZE_STEP = 0.05 # scale difference between cached sizes
+
+# spatial indexing
+FOOD_GRID_CELL = 128 # cell size of the food grid used for nearest food queries, collisions and merging
+
+# food merging
+MERGE_RESET_DARK_MATTER = 'pass' # reset dark matter once per 'pass' that merged food, or once per 'merge'
+
+# rendering
+BACKGROUND_COLOUR = (0, 10, 50)
+DIRTY_RECTS = False # only redraw screen areas covered by sprites this frame or the last (full redraws while the hud is shown)
+SHOW_DRAW_COUNTS = False # overlay of sprites drawn vs culled, toggled with c
+HUD_CACHE_SIZE = 256 # max rendered strings and translucent shapes kept by the hud
+
+# profiler
+PROFILER_ENABLED = False # time each phase of a tick and show the profiler panel, toggled with p
+PROFILER_SAMPLES = 300 # ticks kept for the profiler percentiles
+PROFILER_REFRESH = 15 # ticks between profiler panel updates
+
+# checkpoints
+CHECKPOINT_FILE = 'checkpoint.npz' # saved with f5 and restored with f9
+
 # initial conditions
 INIT_ENERGY_RESERVE = 1000 # must be larger than sum of initial organism and food energy
 INIT_POP_SIZE = 10
@@ -22,4 +61,16 @@ INIT_ORGANISM_AGILITY = 10
 MAX_POP_SIZE = 100
 MAX_FOOD = 100
 MIN_ORGANISM_SIZE = 0.2
-MAX_ORGANISM_SIZE = 1
\ No newline at end of file
+MAX_ORGANISM_SIZE = 1
+
+# reproduction
+OFFSPRING_PER_TICK = 2 # max crossovers each reproduction tick (once a second)
+LITTER_SIZE = 2 # crossovers of each pair of parents
+
+# islands (main.py --islands)
+MIGRATION_INTERVAL = 60 # simulated seconds each island runs between migrations
+NUM_MIGRANTS = 2 # fittest genomes each island sends to the next one at every migration
+
+# collisions
+ORGANISM_RADIUS = 32 # organism collision radius at size 1, used where masks are not
+COLLISION_MASK = True # pixel-perfect mask test after the circle broad phase (ignored when headless)
\ No newline at end of file
@@ -0,0 +1,123 @@
+import numpy as np
+from support import gather_ranges, wrap_diffs
+from settings import *
+
+class Spatial_grid:
+    # uniform grid over a particle system that wraps around the map edges. the grid is rebuilt lazily whenever
+    # the system has changed (particles moved, added or removed) since the last query
+    def __init__(self, system, cell_size=FOOD_GRID_CELL):
+        self.system = system
+        self.num_cells_x = max(1, round(MAP_WIDTH / cell_size))
+        self.num_cells_y = max(1, round(MAP_HEIGHT / cell_size))
+        self.cell_width = MAP_WIDTH / self.num_cells_x
+        self.cell_height = MAP_HEIGHT / self.num_cells_y
+        self.version = None
+
+    def update(self):
+        if self.version == self.system.version:
+            return
+        self.version = self.system.version
+        self.pos = self.system.positions().copy()
+        self.radius = self.system.radius[:self.system.count].copy()
+        self.sprites = list(self.system.sprites)
+        cells = self.calc_cells(self.pos)
+        self.order = np.argsort(cells, kind='stable')
+        counts = np.bincount(cells, minlength=self.num_cells_x * self.num_cells_y)
+        self.starts = np.concatenate(([0], np.cumsum(counts)))
+
+    def calc_cells(self, points):
+        cell_x = np.clip((points[:, 0] // self.cell_width).astype(int), 0, self.num_cells_x - 1)
+        cell_y = np.clip((points[:, 1] // self.cell_height).astype(int), 0, self.num_cells_y - 1)
+        return cell_x * self.num_cells_y + cell_y
+
+    def query_cells(self, queries, cells):
+        # every (query, particle) pair for particles in the given cell of each query
+        starts = self.starts[cells]
+        ends = self.starts[cells + 1]
+        particles = self.order[gather_ranges(starts, ends)]
+        return np.repeat(queries, ends - starts), particles
+
+    def overlaps(self, points, radii):
+        # every (point, particle) pair where a circle around the point overlaps a particle, using the grid as a
+        # broad phase. pairs are ordered by point, then by particle
+        self.update()
+        if len(points) == 0 or len(self.pos) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        cells = self.calc_cells(points)
+        reach = (radii.max() + self.radius.max()) / min(self.cell_width, self.cell_height)
+        offset_x, offset_y = block_offsets(int(np.ceil(reach)), self.num_cells_x, self.num_cells_y)
+        block_cells = ((cells[:, None] // self.num_cells_y + offset_x) % self.num_cells_x * self.num_cells_y
+                       + (cells[:, None] % self.num_cells_y + offset_y) % self.num_cells_y)
+        queries, particles = self.query_cells(np.repeat(np.arange(len(points)), len(offset_x)), block_cells.ravel())
+        dx = self.pos[particles, 0] - points[queries, 0]
+        dy = self.pos[particles, 1] - points[queries, 1]
+        wrap_diffs(dx, dy)
+        hit = dx * dx + dy * dy <= (radii[queries] + self.radius[particles])**2
+        queries = queries[hit]
+        particles = particles[hit]
+        order = np.lexsort((particles, queries))
+        return queries[order], particles[order]
+
+    def nearest(self, points, max_radius):
+        # nearest particle with radius <= max_radius to each point, searched in rings of cells around the point.
+        # returns the distance and the minimum-image difference vector, or inf and zero where nothing is in range
+        self.update()
+        num_points = len(points)
+        best_r = np.full(num_points, np.inf)
+        best_dx = np.zeros(num_points)
+        best_dy = np.zeros(num_points)
+        if num_points == 0 or len(self.pos) == 0:
+            return best_r, best_dx, best_dy
+        cells = self.calc_cells(points)
+        cell_x = cells // self.num_cells_y
+        cell_y = cells % self.num_cells_y
+        active = np.arange(num_points)
+        max_ring = max(self.num_cells_x, self.num_cells_y) // 2 + 1
+        for ring in range(max_ring + 1):
+            offset_x, offset_y = ring_offsets(ring)
+            ring_cells = ((cell_x[active, None] + offset_x) % self.num_cells_x * self.num_cells_y
+                          + (cell_y[active, None] + offset_y) % self.num_cells_y)
+            queries, particles = self.query_cells(np.repeat(active, len(offset_x)), ring_cells.ravel())
+            if len(queries):
+                dx = self.pos[particles, 0] - points[queries, 0]
+                dy = self.pos[particles, 1] - points[queries, 1]
+                wrap_diffs(dx, dy)
+                r = np.sqrt(dx * dx + dy * dy)
+                r[self.radius[particles] > max_radius[queries]] = np.inf
+                # closest candidate of each query in this ring
+                order = np.lexsort((r, queries))
+                first = order[np.flatnonzero(np.diff(queries[order], prepend=-1))]
+                closer = r[first] < best_r[queries[first]]
+                first = first[closer]
+                best_r[queries[first]] = r[first]
+                best_dx[queries[first]] = dx[first]
+                best_dy[queries[first]] = dy[first]
+            # anything in the next ring is at least this far from the point
+            min_unsearched = ring * min(self.cell_width, self.cell_height)
+            active = active[best_r[active] > min_unsearched]
+            if len(active) == 0:
+                break
+        return best_r, best_dx, best_dy
+
+def block_offsets(reach, num_cells_x, num_cells_y):
+    # cell offsets within a chebyshev distance of reach, without visiting a cell twice on small grids
+    if 2 * reach + 1 < num_cells_x:
+        range_x = np.arange(-reach, reach + 1)
+    else:
+        range_x = np.arange(num_cells_x)
+    if 2 * reach + 1 < num_cells_y:
+        range_y = np.arange(-reach, reach + 1)
+    else:
+        range_y = np.arange(num_cells_y)
+    offset_x, offset_y = np.meshgrid(range_x, range_y, indexing='ij')
+    return offset_x.ravel(), offset_y.ravel()
+
+def ring_offsets(ring):
+    # cell offsets at a chebyshev distance of exactly ring
+    if ring == 0:
+        return np.zeros(1, dtype=int), np.zeros(1, dtype=int)
+    side = np.arange(-ring, ring + 1)
+    inner = np.arange(-ring + 1, ring)
+    offset_x = np.concatenate((side, side, np.full(len(inner), -ring), np.full(len(inner), ring)))
+    offset_y = np.concatenate((np.full(len(side), -ring), np.full(len(side), ring), inner, inner))
+    return offset_x, offset_y
@@ -1,4 +1,5 @@
 import math, pygame
+import numpy as np
 from os import walk
 from settings import *
 
@@ -22,11 +23,32 @@ def calc_diff(vector1, vector2):
         diff.y += MAP_HEIGHT
     return diff
 
+def wrap_diffs(dx, dy):
+    # minimum-image convention of calc_diff applied to arrays of differences in place
+    dx[dx > MAP_WIDTH // 2] -= MAP_WIDTH
+    dx[dx < -(MAP_WIDTH // 2)] += MAP_WIDTH
+    dy[dy > MAP_HEIGHT // 2] -= MAP_HEIGHT
+    dy[dy < -(MAP_HEIGHT // 2)] += MAP_HEIGHT
+
+def gather_ranges(starts, ends):
+    # concatenation of np.arange(start, end) for every start, end pair
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.arange(lengths.sum()) + offsets
+
 def import_folder(path):
     surface_list = []
     for _, __, image_files in walk(path):
-        for image in image_files:
+        # walk order is arbitrary, so frames are sorted by their numeric names (0.png, 1.png, ..., 10.png)
+        for image in sorted(image_files, key=frame_order):
             full_path = path + '/' + image
             image_surf = pygame.image.load(full_path).convert_alpha()
             surface_list.append(image_surf)
+        break
     return surface_list
+
+def frame_order(file_name):
+    name = file_name.rsplit('.', 1)[0]
+    if name.isdigit():
+        return 0, int(name), file_name
+    return 1, 0, file_name